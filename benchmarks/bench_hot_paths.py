@@ -0,0 +1,231 @@
+"""
+熱點純函式的效能基準測試
+以 datagen 產生的固定資料量測 menu_utils 的菜單整理、店家搜尋、團購選單、店家查找、
+管理頁彙總，以及 db.py 的資料列轉換；每項記錄耗時（中位數、最小值）與記憶體峰值（tracemalloc）。
+
+用法（於專案根目錄執行）：
+    python benchmarks/bench_hot_paths.py                  # 執行並與 benchmarks/baseline.json 比較
+    python benchmarks/bench_hot_paths.py --quick          # 省略 10k 店家與 100k 訂單等大型資料
+    python benchmarks/bench_hot_paths.py --save-baseline  # 以本次結果取代基準值
+
+結果寫入 --output（預設 benchmarks/results.json）。任一項目的耗時或記憶體峰值超過基準值加上容許比例時，
+列出退步的項目並以結束碼 1 結束。基準值與機器相關，換機器或 CI 環境時請先重新產生。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tracemalloc
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import pandas as pd
+
+import db
+from menu_utils import (
+    sanitize_menu_dataframe, vendor_matches_query, get_group_options, find_vendor_by_name,
+    normalize_loaded_vendor, normalize_loaded_group, orders_to_dataframe, summarize_orders,
+)
+from datagen import generate_catalog
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+RESULTS_PATH = os.path.join(BENCH_DIR, "results.json")
+
+VENDOR_COUNTS = (10, 1_000, 10_000)
+ORDER_COUNTS = (1_000, 10_000, 100_000)
+QUICK_VENDOR_COUNTS = (10, 1_000)
+QUICK_ORDER_COUNTS = (1_000, 10_000)
+# 訂單列表一頁的筆數（menu.py ORDER_PAGE_SIZES 的最大值）
+ORDER_PAGE_SIZE = 100
+
+# 耗時低於此值（毫秒）的差異視為量測雜訊，不判定為退步
+NOISE_FLOOR_MS = 1.0
+# 記憶體峰值低於此值（KiB）的差異不判定為退步
+NOISE_FLOOR_KIB = 64
+
+
+def _measure(func, repeat: int) -> dict:
+    """執行 repeat 次量測耗時，另外在 tracemalloc 下執行一次量測記憶體峰值（追蹤會拖慢速度，故分開）"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "peak_kib": round(peak / 1024, 1),
+        "repeat": repeat,
+    }
+
+
+def _repeat_for(size: int) -> int:
+    return 3 if size >= 10_000 else 7
+
+
+def _vendor_cases(vendor_count: int) -> dict:
+    """以 vendor_count 間店家（與同數量的團購）為資料的量測項目"""
+    catalog = generate_catalog(vendor_count, group_count=vendor_count, orders_per_group=0)
+    vendors = [normalize_loaded_vendor(v) for v in db._catalog_vendors(catalog)]
+    groups = [normalize_loaded_group(g) for g in db._catalog_groups(catalog)]
+    raw_menus = [row["menu"] for row in catalog["vendors"]]
+    # 最差情況：要找的店家在清單最後
+    lookup_names = [vendors[-1]["vendor_name"], f"  {vendors[len(vendors) // 2]['vendor_name'].upper()} ", "不存在的店家"]
+
+    return {
+        f"sanitize_menu_dataframe[vendors={vendor_count}]":
+            lambda: [sanitize_menu_dataframe(menu) for menu in raw_menus],
+        f"vendor_matches_query[vendors={vendor_count}]":
+            lambda: [[v for v in vendors if vendor_matches_query(v, q)] for q in ("紅茶", "大稻埕 牛肉麵", "找不到")],
+        f"get_group_options[groups={vendor_count}]":
+            lambda: get_group_options(groups),
+        f"find_vendor_by_name[vendors={vendor_count}]":
+            lambda: [find_vendor_by_name(vendors, name) for name in lookup_names],
+        f"db._catalog_vendors[vendors={vendor_count}]":
+            lambda: db._catalog_vendors(catalog),
+        f"db._catalog_groups[groups={vendor_count}]":
+            lambda: db._catalog_groups(catalog),
+    }
+
+
+def _order_cases(order_count: int) -> dict:
+    """單一飲料團購含 order_count 筆訂單的量測項目"""
+    catalog = generate_catalog(20, group_count=1, orders_per_group=order_count, group_category="飲料")
+    group = catalog["groups"][0]
+    order_rows = catalog["orders"][group["id"]]
+    orders = [db._row_to_order(row) for row in order_rows]
+
+    def admin_summary():
+        df_orders = orders_to_dataframe(orders)
+        summarize_orders(df_orders)
+        df_orders["總價"].sum()
+
+    return {
+        # 匯出 CSV、資料庫無法彙總時載入整個團購的訂單
+        f"db._row_to_order[orders={order_count}]": lambda: [db._row_to_order(row) for row in order_rows],
+        f"admin_summary[orders={order_count}]": admin_summary,
+    }
+
+
+def _page_cases() -> dict:
+    """訂單列表每次重跑只轉換一頁的資料列"""
+    catalog = generate_catalog(20, group_count=1, orders_per_group=ORDER_PAGE_SIZE, group_category="飲料")
+    page_rows = catalog["orders"][catalog["groups"][0]["id"]]
+    return {
+        f"db._row_to_order[page={ORDER_PAGE_SIZE}]": lambda: [db._row_to_order(row) for row in page_rows],
+    }
+
+
+def run(quick: bool) -> dict:
+    results = {}
+    for vendor_count in (QUICK_VENDOR_COUNTS if quick else VENDOR_COUNTS):
+        for name, func in _vendor_cases(vendor_count).items():
+            results[name] = _measure(func, _repeat_for(vendor_count))
+            print(f"  {name:<48} {results[name]['median_ms']:>10.2f} ms  {results[name]['peak_kib']:>10.1f} KiB")
+    for name, func in _page_cases().items():
+        results[name] = _measure(func, _repeat_for(ORDER_PAGE_SIZE))
+        print(f"  {name:<48} {results[name]['median_ms']:>10.2f} ms  {results[name]['peak_kib']:>10.1f} KiB")
+    for order_count in (QUICK_ORDER_COUNTS if quick else ORDER_COUNTS):
+        for name, func in _order_cases(order_count).items():
+            results[name] = _measure(func, _repeat_for(order_count))
+            print(f"  {name:<48} {results[name]['median_ms']:>10.2f} ms  {results[name]['peak_kib']:>10.1f} KiB")
+    return results
+
+
+def compare(results: dict, baseline: dict, time_tolerance: float, memory_tolerance: float) -> list:
+    """回傳退步項目的說明；只比較兩邊都有的項目"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        time_limit = max(base["median_ms"] * (1 + time_tolerance), base["median_ms"] + NOISE_FLOOR_MS)
+        if current["median_ms"] > time_limit:
+            regressions.append(
+                f"{name}: 耗時 {current['median_ms']:.2f} ms，基準 {base['median_ms']:.2f} ms"
+                f"（+{current['median_ms'] / base['median_ms'] - 1:.0%}）"
+            )
+        memory_limit = max(base["peak_kib"] * (1 + memory_tolerance), base["peak_kib"] + NOISE_FLOOR_KIB)
+        if current["peak_kib"] > memory_limit:
+            regressions.append(
+                f"{name}: 記憶體峰值 {current['peak_kib']:.1f} KiB，基準 {base['peak_kib']:.1f} KiB"
+                f"（+{current['peak_kib'] / base['peak_kib'] - 1:.0%}）"
+            )
+    return regressions
+
+
+def _environment() -> dict:
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+    }
+
+
+def _write_json(path: str, payload: dict) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="熱點純函式的效能基準測試")
+    parser.add_argument("--quick", action="store_true", help="省略最大的資料量")
+    parser.add_argument("--output", default=RESULTS_PATH, help="結果 JSON 的路徑")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基準值 JSON 的路徑")
+    parser.add_argument("--save-baseline", action="store_true", help="以本次結果取代基準值")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="耗時容許增加的比例（預設 0.5 = 50%%）")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2, help="記憶體峰值容許增加的比例（預設 0.2 = 20%%）")
+    args = parser.parse_args(argv)
+
+    print(f"{'項目':<50} {'耗時中位數':>10}  {'記憶體峰值':>10}")
+    payload = {"environment": _environment(), "quick": args.quick, "results": run(args.quick)}
+    _write_json(args.output, payload)
+    print(f"\n結果已寫入 {args.output}")
+
+    if args.save_baseline:
+        _write_json(args.baseline, payload)
+        print(f"基準值已更新：{args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"找不到基準值 {args.baseline}，請先以 --save-baseline 產生")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    missing = sorted(set(baseline["results"]) - set(payload["results"]))
+    if missing and not args.quick:
+        print(f"注意：基準值中有 {len(missing)} 個項目本次未執行：{', '.join(missing)}")
+
+    regressions = compare(payload["results"], baseline["results"], args.time_tolerance, args.memory_tolerance)
+    if regressions:
+        print("\n" + "=" * 60)
+        print(f"❌ 效能退步：{len(regressions)} 項超過基準值（基準建立於 {baseline['environment']['created_at']}）")
+        print("=" * 60)
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+
+    print("✅ 所有項目皆在基準值容許範圍內")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
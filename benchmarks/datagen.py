@@ -0,0 +1,150 @@
+"""
+效能基準測試用的合成資料
+以固定亂數種子產生與資料庫相同格式的原始資料列（與本機快照相同的 catalog 結構），
+同樣的參數每次都會得到完全相同的資料，結果才能和基準值比較。
+"""
+import base64
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from db import TAIWAN_TZ
+
+DEFAULT_SEED = 20260101
+# 收單時間以此為中心前後分佈；實際是否「進行中」取決於執行當下，不影響資料內容
+BASE_TIME = datetime(2026, 1, 1, 12, 0, tzinfo=TAIWAN_TZ)
+
+PLACE_NAMES = ["大稻埕", "公館", "士林", "永康街", "東區", "西門", "南機場", "北投", "中山", "信義", "板橋", "新莊"]
+OWNER_NAMES = ["阿明", "老張", "小林", "阿嬤", "王媽媽", "陳記", "黃家", "李師傅", "巷口", "好味"]
+SHOP_TYPES = {
+    "餐點": ["牛肉麵", "便當", "滷肉飯", "水餃", "鍋貼", "炒飯", "拉麵", "咖哩", "燒臘", "素食"],
+    "飲料": ["手搖飲", "茶飲", "咖啡", "果汁", "豆花", "冰品"],
+    "其他": ["麵包", "甜點", "水果", "滷味", "鹹酥雞"],
+}
+DISH_PARTS = {
+    "餐點": (["紅燒", "清燉", "麻辣", "香酥", "蔥爆", "三杯", "糖醋", "椒鹽", "蒜泥", "咖哩"],
+             ["牛肉麵", "排骨飯", "雞腿飯", "豬排飯", "魚排飯", "炒麵", "餛飩湯", "水餃", "鍋貼", "燴飯"]),
+    "飲料": (["珍珠", "波霸", "椰果", "仙草", "布丁", "芋圓", "蜂蜜", "檸檬", "百香", "黑糖"],
+             ["紅茶", "綠茶", "烏龍", "奶茶", "鮮奶茶", "拿鐵", "冬瓜茶", "青茶", "多多", "冰沙"]),
+    "其他": (["原味", "起司", "巧克力", "抹茶", "草莓", "芋泥", "紅豆", "花生", "奶酥", "肉鬆"],
+             ["吐司", "蛋糕", "泡芙", "銅鑼燒", "鬆餅", "雞排", "豆干", "米血", "甜不辣", "百頁"]),
+}
+SECTIONS = {
+    "餐點": ["主食", "湯品", "小菜"],
+    "飲料": ["茶類", "奶茶", "鮮奶", "特調"],
+    "其他": ["招牌", "季節限定"],
+}
+SURNAMES = "陳林黃張李王吳劉蔡楊許鄭謝郭洪曾邱廖賴周"
+GIVEN_NAMES = "怡君雅婷家豪志明淑芬俊傑美玲建宏佩珊宗翰"
+NOTES = ["", "", "", "不要香菜", "不要辣", "加辣", "飯少", "麵硬", "醬另外放", "餐具不用"]
+SUGAR_CHOICES = ["正常糖", "少糖 (7分)", "半糖 (5分)", "微糖 (3分)", "一分糖", "無糖"]
+ICE_CHOICES = ["正常冰", "少冰", "微冰", "去冰", "完全去冰", "溫", "熱"]
+TOPPING_CHOICES = ["珍珠", "椰果", "布丁", "仙草"]
+
+# 約一成店家附有菜單圖片（以隨機位元組模擬，大小與壓縮後的手機照片縮圖相近）
+IMAGE_RATIO = 0.1
+IMAGE_BYTES = 24 * 1024
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _menu(rng: random.Random, category: str, item_count: int) -> list:
+    """菜單資料列；夾雜空白品名、文字價格與重複品項，模擬使用者貼上的原始資料"""
+    prefixes, dishes = DISH_PARTS[category]
+    sections = SECTIONS[category]
+    menu = []
+    for _ in range(item_count):
+        name = rng.choice(prefixes) + rng.choice(dishes)
+        price = rng.randrange(30, 300, 5)
+        roll = rng.random()
+        if roll < 0.03:
+            name = "  "
+        elif roll < 0.06:
+            price = f"{price}元"
+        elif roll < 0.10:
+            name = f" {name} "
+        menu.append({"品名": name, "價格": price, "分區": rng.choice(sections)})
+    return menu
+
+
+def _image_b64(rng: random.Random):
+    if rng.random() >= IMAGE_RATIO:
+        return None
+    return base64.b64encode(rng.randbytes(IMAGE_BYTES)).decode("ascii")
+
+
+def _vendor_row(rng: random.Random, index: int) -> dict:
+    category = rng.choices(list(SHOP_TYPES), weights=[6, 3, 1])[0]
+    # 加上序號確保店名不重複（find_vendor_by_name 以店名比對）
+    name = f"{rng.choice(OWNER_NAMES)}{rng.choice(PLACE_NAMES)}{rng.choice(SHOP_TYPES[category])} {index + 1}號店"
+    option_sets = []
+    if category == "飲料" and rng.random() < 0.5:
+        option_sets = [
+            {"name": "甜度", "choices": SUGAR_CHOICES},
+            {"name": "冰塊", "choices": ICE_CHOICES},
+            {"name": "加料", "choices": TOPPING_CHOICES},
+        ]
+    return {
+        "id": _uuid(rng),
+        "vendor_name": name,
+        "category": category,
+        "description": f"{rng.choice(PLACE_NAMES)}在地老店，電話 02-{rng.randrange(2000, 2999)}-{rng.randrange(1000, 9999)}",
+        "menu": _menu(rng, category, rng.randrange(15, 60)),
+        "option_sets": option_sets,
+        "menu_image_b64": _image_b64(rng),
+    }
+
+
+def _order_row(rng: random.Random, group: dict, deadline: datetime) -> dict:
+    menu = [item for item in group["menu"] if str(item["品名"]).strip() and isinstance(item["價格"], int)]
+    item = rng.choice(menu)
+    quantity = rng.choices([1, 2, 3, 5], weights=[80, 12, 6, 2])[0]
+    is_drink = group["category"] == "飲料"
+    ordered_at = deadline - timedelta(seconds=rng.randrange(60, 3 * 86400))
+    return {
+        "id": _uuid(rng),
+        "group_id": group["id"],
+        "user_name": rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES) + rng.choice(GIVEN_NAMES),
+        "item_name": item["品名"].strip(),
+        "sugar": rng.choice(SUGAR_CHOICES) if is_drink else "",
+        "ice": rng.choice(ICE_CHOICES) if is_drink else "",
+        "options": {"加料": rng.choice(TOPPING_CHOICES)} if is_drink and rng.random() < 0.3 else {},
+        "unit_price": item["價格"],
+        "quantity": quantity,
+        "total_price": item["價格"] * quantity,
+        "note": rng.choice(NOTES),
+        "ordered_at": ordered_at.isoformat(),
+    }
+
+
+def generate_catalog(vendor_count: int, group_count: int = 0, orders_per_group: int = 0,
+                     group_category: str = None, seed: int = DEFAULT_SEED) -> dict:
+    """產生 {"vendors": [...], "groups": [...], "orders": {group_id: [...]}}
+
+    團購由隨機店家開團（菜單、選項複製自店家；指定 group_category 時只從該類別的店家挑選），
+    每個團購各有 orders_per_group 筆訂單。
+    """
+    rng = random.Random(seed)
+    vendors = [_vendor_row(rng, i) for i in range(vendor_count)]
+    candidates = [v for v in vendors if group_category in (None, v["category"])]
+
+    groups, orders = [], {}
+    for _ in range(group_count):
+        vendor = rng.choice(candidates)
+        deadline = BASE_TIME + timedelta(minutes=rng.randrange(-30 * 24 * 60, 30 * 24 * 60, 30))
+        group = {
+            "id": _uuid(rng),
+            "vendor_name": vendor["vendor_name"],
+            "category": vendor["category"],
+            "description": vendor["description"],
+            "deadline": deadline.isoformat(),
+            "created_at": (deadline - timedelta(days=rng.randrange(1, 4))).isoformat(),
+            "menu": vendor["menu"],
+            "option_sets": vendor["option_sets"],
+            "menu_image_b64": vendor["menu_image_b64"],
+        }
+        groups.append(group)
+        orders[group["id"]] = [_order_row(rng, group, deadline) for _ in range(orders_per_group)]
+    return {"vendors": vendors, "groups": groups, "orders": orders}
@@ -0,0 +1,58 @@
+"""
+斷路器
+連續連線失敗達門檻後暫停呼叫外部服務，資料庫（db.py）與共用快取（shared_cache.py）各用一個。
+"""
+import time
+import threading
+
+
+class CircuitBreaker:
+    """斷路器：連續連線失敗達門檻後「開路」，冷卻期間直接略過呼叫，不再逐次等待逾時
+
+    冷卻結束後進入「半開」狀態，只放行一次試探呼叫：成功則恢復，失敗則重新開路。
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_started_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """"closed"（正常）、"open"（開路）或 "half_open"（可試探）"""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return "open"
+            return "half_open"
+
+    def allow(self) -> bool:
+        """是否可以呼叫"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            # 半開：同一時間只放行一次試探（試探者未回報時，逾時後再放行下一次）
+            if self._trial_started_at is not None and now - self._trial_started_at < self.reset_timeout:
+                return False
+            self._trial_started_at = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_started_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_started_at = None
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
@@ -3,14 +3,44 @@ Supabase 雲端資料庫存取層
 封裝所有 CRUD 操作，讓 menu.py 不需直接操作資料庫
 """
 import os
+import time
 import base64
+import asyncio
+import threading
+import contextlib
+import concurrent.futures
+import httpx
 import streamlit as st
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions, acreate_client, AClient
+from postgrest.exceptions import APIError
 from datetime import datetime, timezone, timedelta
 
+import snapshot
+import shared_cache
+from circuit_breaker import CircuitBreaker
+from order_writer import OrderBatchWriter
+
 # 台灣時區設定 (+08:00)
 TAIWAN_TZ = timezone(timedelta(hours=8))
 
+# 非同步載入時，同時進行中的查詢上限（避免一次對資料庫發出過多請求）
+DB_MAX_CONCURRENCY = int(os.environ.get("DB_MAX_CONCURRENCY", "8"))
+
+# 單次資料庫請求的逾時秒數
+DB_TIMEOUT_SECONDS = float(os.environ.get("DB_TIMEOUT_SECONDS", "10"))
+
+# 資料庫離線時的寫入策略："queue" = 暫存在本機、恢復後重送；"readonly" = 拒絕寫入
+OFFLINE_WRITE_MODE = os.environ.get("OFFLINE_WRITE_MODE", "queue")
+
+# 訂單批次寫入：收集 ORDER_BATCH_WINDOW_MS 毫秒內送出的訂單合併成一次 insert（設為 0 則逐筆寫入）
+ORDER_BATCH_WINDOW_MS = float(os.environ.get("ORDER_BATCH_WINDOW_MS", "30"))
+ORDER_BATCH_MAX_SIZE = int(os.environ.get("ORDER_BATCH_MAX_SIZE", "100"))
+
+# 收單超過 ARCHIVE_AFTER_DAYS 天的團購（連同訂單）自動搬到封存表（設為 0 則不自動封存）
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "30"))
+# 背景執行緒每隔這麼久封存一次；已用 pg_cron 排程（見 setup_db.sql）時設為 0 關閉
+ARCHIVE_CHECK_INTERVAL_SECONDS = float(os.environ.get("ARCHIVE_CHECK_INTERVAL_SECONDS", "21600"))
+
 def to_tz_aware_iso(dt: datetime) -> str:
     """將 datetime 轉換為帶有台灣時區的 ISO 字串（以便存入資料庫）"""
     if dt.tzinfo is None:
@@ -30,12 +60,8 @@ def to_local_naive(dt_str: str) -> datetime:
     return dt
 
 
-def _get_supabase_client() -> Client:
-    """取得 Supabase 客戶端（單例模式，透過 st.cache_resource 快取）"""
-    if "supabase_client" in st.session_state:
-        return st.session_state.supabase_client
-
-    # 優先從 Streamlit secrets 讀取，其次從環境變數
+def _get_supabase_credentials() -> tuple:
+    """讀取 Supabase 連線資訊（優先從 Streamlit secrets 讀取，其次從環境變數）"""
     try:
         url = st.secrets["SUPABASE_URL"]
         key = st.secrets["SUPABASE_KEY"]
@@ -55,17 +81,457 @@ def _get_supabase_client() -> Client:
         )
         st.stop()
 
-    client = create_client(url, key)
+    return url, key
+
+
+def _get_supabase_client() -> Client:
+    """取得 Supabase 客戶端（單例模式，快取在 session_state 中）"""
+    if "supabase_client" in st.session_state:
+        return st.session_state.supabase_client
+
+    url, key = _get_supabase_credentials()
+    client = create_client(url, key, options=ClientOptions(postgrest_client_timeout=DB_TIMEOUT_SECONDS))
     st.session_state.supabase_client = client
     return client
 
 
+# ==================== 斷路器 ====================
+
+# 同一程序內所有 session 共用，一個 session 偵測到離線，其他 session 也不必再等逾時
+_breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get("DB_BREAKER_THRESHOLD", "3")),
+    reset_timeout=float(os.environ.get("DB_BREAKER_RESET_SECONDS", "30")),
+)
+
+
+# PostgREST 連不上或等不到資料庫連線（PGRST000~003），以及 PostgreSQL 的連線中斷、關機、連線數已滿
+_UNAVAILABLE_ERROR_CODES = {"PGRST000", "PGRST001", "PGRST002", "PGRST003", "57P01", "57P02", "57P03", "53300"}
+
+
+def _is_server_unavailable_code(code) -> bool:
+    """HTTP 5xx（閘道回傳非 JSON 內容時 postgrest 以狀態碼當作 code）或代表服務無法使用的錯誤碼"""
+    code = str(code or "")
+    if len(code) == 3 and code.isdigit():  # HTTP 狀態碼；5 碼的是 PostgreSQL SQLSTATE
+        return int(code) >= 500
+    return code in _UNAVAILABLE_ERROR_CODES or code.startswith("08")
+
+
+def _is_connection_error(e: Exception) -> bool:
+    """是否為連線層級的錯誤（逾時、無法連線、閘道或資料庫暫停服務），而非資料本身的錯誤"""
+    if isinstance(e, (httpx.TransportError, OSError)):
+        return True
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500
+    if isinstance(e, APIError):
+        return _is_server_unavailable_code(e.code)
+    return False
+
+
+@contextlib.asynccontextmanager
+async def _async_session():
+    """建立一次非同步載入所需的客戶端與併發上限
+
+    非同步客戶端綁定在建立它的事件迴圈上，因此每次 asyncio.run 都重新建立，用完即關閉。
+    """
+    url, key = _get_supabase_credentials()
+    client: AClient = await acreate_client(url, key)
+    limiter = asyncio.Semaphore(DB_MAX_CONCURRENCY)
+    try:
+        yield client, limiter
+    finally:
+        with contextlib.suppress(Exception):
+            await client.postgrest.aclose()
+
+
+def _run_async(coro):
+    """在同步程式碼（Streamlit 頁面）中執行協程並回傳結果"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    # 目前執行緒已有事件迴圈在跑（例如在 notebook 中呼叫）→ 改到獨立執行緒執行
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+async def _afetch_rows(client: AClient, limiter: asyncio.Semaphore, table: str, **filters) -> list:
+    """以非同步方式查詢一張表（受併發上限控制），filters 為等值條件"""
+    async with limiter:
+        query = client.table(table).select("*")
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        resp = await asyncio.wait_for(query.execute(), DB_TIMEOUT_SECONDS)
+        return resp.data
+
+
+def _catalog_scopes(tables: tuple) -> tuple:
+    """資料表對應的共用快取範圍（訂單不隨目錄載入，見 db_load_orders_page / db_load_order_summary）"""
+    return tuple(table for table in ("vendors", "groups") if table in tables)
+
+
+async def _afetch_catalog(client: AClient, limiter: asyncio.Semaphore, scopes: tuple) -> dict:
+    """同時抓取指定快取範圍的原始資料列，回傳快照格式 {"vendors": [...], "groups": [...]} 中抓取的部分"""
+    fetched = await asyncio.gather(*(_afetch_rows(client, limiter, scope) for scope in scopes))
+    return dict(zip(scopes, fetched))
+
+
+async def _aload_catalog(tables: tuple) -> tuple:
+    """載入原始資料列：共用快取中目前版本已有的部分直接使用，其餘經由斷路器向資料庫查詢
+
+    回傳 (catalog, versions, fetched)：versions 為載入前讀到的版本號（快取無法使用時為 None），
+    fetched 表示是否查詢過資料庫；資料庫無法使用時回傳 (None, versions, False)。
+    """
+    scopes = _catalog_scopes(tables)
+    # 先讀版本號再查資料庫：查詢期間若有寫入，存入的是舊版本，不會蓋過新資料
+    versions = shared_cache.versions(scopes)
+    catalog = {}
+    if versions is not None:
+        for scope, version in zip(scopes, versions):
+            rows = shared_cache.get(scope, version)
+            if rows is not None:
+                catalog[scope] = rows
+
+    missing = tuple(scope for scope in scopes if scope not in catalog)
+    if not missing:
+        return catalog, versions, False
+
+    if not _breaker.allow():
+        return None, versions, False
+    try:
+        async with _async_session() as (client, limiter):
+            fetched = await _afetch_catalog(client, limiter, missing)
+    except Exception as e:
+        if _is_connection_error(e):
+            _breaker.record_failure()
+        else:
+            _breaker.record_success()
+        st.warning(f"載入雲端資料時發生錯誤: {e}")
+        return None, versions, False
+    _breaker.record_success()
+
+    if versions is not None:
+        for scope, version in zip(scopes, versions):
+            if scope in fetched:
+                shared_cache.put(scope, version, fetched[scope])
+    catalog.update(fetched)
+    return catalog, versions, True
+
+
+# ==================== 資料列轉換 ====================
+
+def _decode_image(row: dict):
+    """將資料列中的 base64 圖片還原為 bytes"""
+    if row.get("menu_image_b64"):
+        return base64.b64decode(row["menu_image_b64"])
+    return None
+
+
+def _row_to_vendor(row: dict) -> dict:
+    """將 vendors 資料列轉換為 menu.py 使用的店家 dict"""
+    return {
+        "id": row["id"],
+        "vendor_name": row.get("vendor_name", ""),
+        "category": row.get("category", "餐點"),
+        "description": row.get("description", ""),
+        "menu": row.get("menu", []),  # 會在 menu.py 中由 sanitize_menu_dataframe 處理
+        "option_sets": row.get("option_sets") or [],
+        "menu_image_bytes": _decode_image(row),
+    }
+
+
+def _row_to_order(row: dict) -> dict:
+    """將 orders 資料列轉換為 menu.py 使用的訂單 dict"""
+    return {
+        "id": row.get("id"),
+        "姓名": row.get("user_name", ""),
+        "品項": row.get("item_name", ""),
+        "甜度": row.get("sugar") or "",
+        "冰塊": row.get("ice") or "",
+        "選項": row.get("options") or {},
+        "單價": row.get("unit_price", 0),
+        "數量": row.get("quantity", 1),
+        "總價": row.get("total_price", 0),
+        "備註": row.get("note", ""),
+        "下單時間": row.get("ordered_at", ""),
+    }
+
+
+def _row_to_group(row: dict) -> dict:
+    """將 groups 資料列轉換為 menu.py 使用的團購 dict（不含訂單，訂單依需要分頁或彙總查詢）"""
+    return {
+        "id": row["id"],
+        "vendor_name": row.get("vendor_name", ""),
+        "category": row.get("category", "餐點"),
+        "description": row.get("description", ""),
+        "deadline": to_local_naive(row.get("deadline")),
+        "created_at": to_local_naive(row.get("created_at")),
+        "menu": row.get("menu", []),  # 會在 menu.py 中由 sanitize_menu_dataframe 處理
+        "option_sets": row.get("option_sets") or [],
+        "menu_image_bytes": _decode_image(row),
+    }
+
+
+def _catalog_vendors(catalog: dict) -> list:
+    return [_row_to_vendor(row) for row in catalog.get("vendors", [])]
+
+
+def _catalog_groups(catalog: dict) -> list:
+    return [_row_to_group(row) for row in catalog.get("groups", [])]
+
+
+# ==================== 本機快照與離線模式 ====================
+
+def db_load_snapshot():
+    """從本機快照載入上次成功的資料，回傳 (vendors, groups)；沒有快照時回傳 None"""
+    catalog = snapshot.load_snapshot()
+    if catalog is None:
+        return None
+    return _catalog_vendors(catalog), _catalog_groups(catalog)
+
+
+def db_status() -> dict:
+    """回傳資料庫連線狀態（供系統資訊顯示）"""
+    return {
+        "breaker": _breaker.state,
+        "offline_write_mode": OFFLINE_WRITE_MODE,
+        "pending_writes": len(snapshot.read_pending_writes()),
+        "snapshot_saved_at": snapshot.snapshot_saved_at(),
+        "cache": shared_cache.status(),
+        "archive_last_error": _archive_last_error,
+    }
+
+
+def db_catalog_version():
+    """共用快取中店家與團購的版本號；任何副本寫入後都會改變，快取無法使用時回傳 None"""
+    return shared_cache.versions()
+
+
+def db_remember_catalog_version() -> None:
+    """記下本 session 即將載入的店家與團購版本號（在載入前呼叫：載入期間若有寫入，下次比對會再載入一次）"""
+    st.session_state["_catalog_version"] = db_catalog_version()
+    st.session_state["_catalog_loaded_at"] = time.monotonic()
+
+
+def db_catalog_changed() -> bool:
+    """其他 session 或副本是否改過店家或團購（本 session 自己的寫入不算；訂單異動不影響目錄）
+
+    載入超過 SHARED_CACHE_TTL_SECONDS 也視為已變更：版本號沒有遞增的修改（排程、SQL 直接修改、
+    未共用快取的其他副本）在快取過期後重新載入才看得到。
+    """
+    loaded_at = st.session_state.get("_catalog_loaded_at")
+    if loaded_at is None or time.monotonic() - loaded_at >= shared_cache.SHARED_CACHE_TTL_SECONDS:
+        return True
+    current = db_catalog_version()
+    return current is not None and current != st.session_state.get("_catalog_version")
+
+
+def db_invalidate_catalog() -> None:
+    """手動重新載入前呼叫：遞增店家與團購的版本號，下一次載入直接查詢資料庫，其他 session 與副本也會跟著重新載入"""
+    shared_cache.invalidate(*shared_cache.SCOPES)
+
+
+def _action_scopes(action: dict) -> tuple:
+    """寫入動作影響的快取範圍；訂單只影響所屬團購"""
+    if action["table"] == "orders":
+        group_id = action.get("group_id") or (action.get("row") or {}).get("group_id")
+        return (shared_cache.orders_scope(group_id),) if group_id else ()
+    if action["table"] == "groups" and action["op"] == "delete":
+        return ("groups", shared_cache.orders_scope(action["id"]))  # 訂單由 CASCADE 一併刪除
+    if action["table"] in ("vendors", "groups"):
+        return (action["table"],)
+    return ()
+
+
+def _remember_own_write(bumped: dict) -> None:
+    """本 session 自己的寫入已直接更新記憶體中的資料：版本號恰好比記下的多 1（期間沒有其他人寫入）時視為已看過"""
+    seen = st.session_state.get("_catalog_version")
+    if seen is None:
+        return
+    st.session_state["_catalog_version"] = tuple(
+        bumped[scope] if scope in bumped and version == bumped[scope] - 1 else version
+        for scope, version in zip(shared_cache.SCOPES, seen)
+    )
+
+
+def _invalidate_cache(action: dict, own_write: bool = False) -> None:
+    """寫入成功後通知所有副本相關的快取範圍已變更"""
+    bumped = shared_cache.invalidate(*_action_scopes(action))
+    if own_write:
+        _remember_own_write(bumped)
+
+
+def _apply_write(client: Client, action: dict, replay: bool = False) -> None:
+    """執行一筆寫入動作：{"table", "op": "upsert" | "insert" | "update" | "delete", "row" 及/或 "id"}
+
+    replay=True 表示重送暫存的寫入：先前可能其實已寫入成功（例如等待逾時），insert 改為略過已存在 id 的 upsert。
+    """
+    query = client.table(action["table"])
+    if action["op"] == "upsert":
+        query.upsert(action["row"], on_conflict="id").execute()
+    elif action["op"] == "insert" and replay:
+        query.upsert(action["row"], on_conflict="id", ignore_duplicates=True).execute()
+    elif action["op"] == "insert":
+        query.insert(action["row"]).execute()
+    elif action["op"] == "update":
+        query.update(action["row"]).eq("id", action["id"]).execute()
+    elif action["op"] == "delete":
+        query.delete().eq("id", action["id"]).execute()
+    else:
+        raise ValueError(f"未知的寫入動作: {action['op']}")
+
+
+def db_flush_pending_writes() -> int:
+    """依序重送離線期間暫存的寫入，回傳尚未送出的筆數
+
+    同一時間只有一個重送流程（跨 session 與程序）；其他呼叫者不等待，直接回傳目前暫存的筆數。
+    """
+    with snapshot.pending_writes_flush_lock() as acquired:
+        actions = snapshot.read_pending_writes()
+        if not acquired or not actions or not _breaker.allow():
+            return len(actions)
+
+        client = _get_supabase_client()
+        sent = set()
+        for action in actions:
+            try:
+                _apply_write(client, action, replay=True)
+            except Exception as e:
+                if _is_connection_error(e):
+                    _breaker.record_failure()
+                    break
+                # 資料本身有問題（例如關聯的團購已刪除）→ 略過，避免卡住後面的暫存寫入
+                st.warning(f"暫存資料同步失敗，已略過: {e}")
+            else:
+                _invalidate_cache(action)
+            sent.add(action["pending_id"])
+
+        if sent:
+            _breaker.record_success()
+            snapshot.drop_pending_writes(sent)
+        return len(actions) - len(sent)
+
+
+def _read(build_query, error_label: str):
+    """經由斷路器執行一次同步查詢，build_query(client) 回傳查詢物件；無法取得資料時回傳 None"""
+    if not _breaker.allow():
+        return None
+    try:
+        resp = build_query(_get_supabase_client()).execute()
+    except Exception as e:
+        if _is_connection_error(e):
+            _breaker.record_failure()
+        else:
+            _breaker.record_success()
+        st.warning(f"{error_label}: {e}")
+        return None
+    _breaker.record_success()
+    return resp.data
+
+
+def _defer_write(action: dict, error_label: str) -> bool:
+    if OFFLINE_WRITE_MODE == "readonly":
+        st.error(f"{error_label}: 雲端資料庫暫時無法連線，目前為唯讀模式")
+        return False
+    snapshot.append_pending_write(action)
+    st.warning("⚠️ 雲端資料庫暫時無法連線，此筆資料已暫存在本機，恢復連線後會自動同步")
+    return True
+
+
+def _defer_slow_order(action: dict) -> bool:
+    """等待批次寫入的結果逾時：訂單仍在佇列中，稍後多半會寫入成功，不是資料庫離線
+
+    暫存一份供重送（重送的 insert 會略過已存在的 id，已寫入時不會重複），確保寫入失敗時也不會遺失。
+    """
+    if OFFLINE_WRITE_MODE == "readonly":
+        st.info("⏳ 目前送出的訂單較多，您的訂單仍在寫入中，請稍後在「我的訂單」確認")
+        return True
+    snapshot.append_pending_write(action)
+    st.info("⏳ 目前送出的訂單較多，您的訂單已收到，稍後會自動完成寫入")
+    return True
+
+
+def _write(action: dict, error_label: str, apply=None) -> bool:
+    """經由斷路器執行寫入；資料庫無法連線時依 OFFLINE_WRITE_MODE 暫存或拒絕
+
+    apply(action) 可替換實際的寫入方式（例如交給訂單批次寫入器），預設直接以目前 session 的客戶端寫入。
+    """
+    # 先送出較早暫存的寫入，維持寫入順序（例如先建團購、再下訂單）
+    if snapshot.has_pending_writes() and db_flush_pending_writes():
+        return _defer_write(action, error_label)
+
+    if not _breaker.allow():
+        return _defer_write(action, error_label)
+
+    try:
+        if apply is None:
+            _apply_write(_get_supabase_client(), action)
+        else:
+            apply(action)
+    except OrderWaitTimeout:
+        # 只是排隊較久，不計入斷路器
+        return _defer_slow_order(action)
+    except Exception as e:
+        if _is_connection_error(e):
+            _breaker.record_failure()
+            return _defer_write(action, error_label)
+        _breaker.record_success()
+        st.error(f"{error_label}: {e}")
+        return False
+
+    _breaker.record_success()
+    _invalidate_cache(action, own_write=True)
+    return True
+
+
+# ==================== 訂單批次寫入 ====================
+
+# 同一程序內所有 session 共用一個批次寫入器（背景執行緒使用自己的客戶端，不依賴 session_state）
+_order_writer = None
+_order_writer_lock = threading.Lock()
+
+
+def _get_order_writer() -> OrderBatchWriter:
+    global _order_writer
+    with _order_writer_lock:
+        if _order_writer is None:
+            url, key = _get_supabase_credentials()
+            client = create_client(url, key, options=ClientOptions(postgrest_client_timeout=DB_TIMEOUT_SECONDS))
+            _order_writer = OrderBatchWriter(
+                lambda rows: client.table("orders").insert(rows).execute(),
+                window_ms=ORDER_BATCH_WINDOW_MS,
+                max_batch_size=ORDER_BATCH_MAX_SIZE,
+                is_connection_error=_is_connection_error,
+            )
+        return _order_writer
+
+
+class OrderWaitTimeout(Exception):
+    """等待批次寫入器的結果逾時（訂單仍在佇列或寫入中，不代表資料庫離線）"""
+
+
+def _submit_order_to_batch(action: dict) -> None:
+    """交給批次寫入器並等待這一筆的結果"""
+    future = _get_order_writer().submit(action["row"])
+    try:
+        future.result(timeout=DB_TIMEOUT_SECONDS + ORDER_BATCH_WINDOW_MS / 1000)
+    except TimeoutError:
+        # Python 3.11 起等待逾時與連線逾時同為 TimeoutError（OSError 的子類別），以 future 是否完成區分
+        if future.done():
+            raise
+        raise OrderWaitTimeout() from None
+
+
+def db_order_writer_stats():
+    """訂單批次寫入器的統計（批次大小、排隊時間）；尚未啟用時回傳 None"""
+    return _order_writer.stats() if _order_writer is not None else None
+
+
 # ==================== 店家 (vendors) ====================
 
 def db_save_vendor(vendor: dict) -> bool:
     """儲存或更新一筆店家資料"""
     try:
-        client = _get_supabase_client()
         menu_records = vendor["menu"].to_dict("records") if hasattr(vendor["menu"], "to_dict") else vendor["menu"]
 
         # 圖片轉 base64 字串
@@ -83,50 +549,31 @@ def db_save_vendor(vendor: dict) -> bool:
             "category": vendor.get("category", "餐點"),
             "description": vendor.get("description", ""),
             "menu": menu_records,
+            "option_sets": vendor.get("option_sets", []),
             "menu_image_b64": image_b64,
         }
-
-        client.table("vendors").upsert(row, on_conflict="id").execute()
-        return True
     except Exception as e:
         st.error(f"儲存店家失敗: {e}")
         return False
 
+    return _write({"table": "vendors", "op": "upsert", "row": row}, "儲存店家失敗")
+
+
+async def adb_load_vendors() -> list:
+    """載入所有店家（非同步版本；資料庫無法使用時改用本機快照）"""
+    catalog, _, _ = await _aload_catalog(("vendors",))
+    catalog = catalog or snapshot.load_snapshot() or {}
+    return _catalog_vendors(catalog)
+
 
 def db_load_vendors() -> list:
     """載入所有店家"""
-    try:
-        client = _get_supabase_client()
-        resp = client.table("vendors").select("*").execute()
-        vendors = []
-        for row in resp.data:
-            image_bytes = None
-            if row.get("menu_image_b64"):
-                image_bytes = base64.b64decode(row["menu_image_b64"])
-
-            vendors.append({
-                "id": row["id"],
-                "vendor_name": row.get("vendor_name", ""),
-                "category": row.get("category", "餐點"),
-                "description": row.get("description", ""),
-                "menu": row.get("menu", []),  # 會在 menu.py 中由 sanitize_menu_dataframe 處理
-                "menu_image_bytes": image_bytes,
-            })
-        return vendors
-    except Exception as e:
-        st.warning(f"載入店家資料時發生錯誤: {e}")
-        return []
+    return _run_async(adb_load_vendors())
 
 
 def db_delete_vendor(vendor_id: str) -> bool:
     """刪除一筆店家"""
-    try:
-        client = _get_supabase_client()
-        client.table("vendors").delete().eq("id", vendor_id).execute()
-        return True
-    except Exception as e:
-        st.error(f"刪除店家失敗: {e}")
-        return False
+    return _write({"table": "vendors", "op": "delete", "id": vendor_id}, "刪除店家失敗")
 
 
 # ==================== 團購 (groups) ====================
@@ -134,7 +581,6 @@ def db_delete_vendor(vendor_id: str) -> bool:
 def db_save_group(group: dict) -> bool:
     """儲存或更新一筆團購"""
     try:
-        client = _get_supabase_client()
         menu_records = group["menu"].to_dict("records") if hasattr(group["menu"], "to_dict") else group["menu"]
 
         image_b64 = None
@@ -153,91 +599,359 @@ def db_save_group(group: dict) -> bool:
             "deadline": to_tz_aware_iso(group["deadline"]) if isinstance(group["deadline"], datetime) else group["deadline"],
             "created_at": to_tz_aware_iso(group["created_at"]) if isinstance(group["created_at"], datetime) else group["created_at"],
             "menu": menu_records,
+            "option_sets": group.get("option_sets", []),
             "menu_image_b64": image_b64,
         }
-
-        client.table("groups").upsert(row, on_conflict="id").execute()
-        return True
     except Exception as e:
         st.error(f"儲存團購失敗: {e}")
         return False
 
+    return _write({"table": "groups", "op": "upsert", "row": row}, "儲存團購失敗")
+
+
+async def adb_load_groups() -> list:
+    """載入所有團購（不含訂單，非同步版本；資料庫無法使用時改用本機快照）"""
+    catalog, _, _ = await _aload_catalog(("groups",))
+    catalog = catalog or snapshot.load_snapshot() or {}
+    return _catalog_groups(catalog)
+
 
 def db_load_groups() -> list:
-    """載入所有團購（含其訂單）"""
-    try:
-        client = _get_supabase_client()
-        resp = client.table("groups").select("*").execute()
-        groups = []
-        for row in resp.data:
-            image_bytes = None
-            if row.get("menu_image_b64"):
-                image_bytes = base64.b64decode(row["menu_image_b64"])
-
-            # 載入此團購的所有訂單
-            orders_resp = client.table("orders").select("*").eq("group_id", row["id"]).execute()
-            orders = []
-            for o in orders_resp.data:
-                orders.append({
-                    "姓名": o.get("user_name", ""),
-                    "品項": o.get("item_name", ""),
-                    "單價": o.get("unit_price", 0),
-                    "數量": o.get("quantity", 1),
-                    "總價": o.get("total_price", 0),
-                    "備註": o.get("note", ""),
-                    "下單時間": o.get("ordered_at", ""),
-                })
-
-            groups.append({
-                "id": row["id"],
-                "vendor_name": row.get("vendor_name", ""),
-                "category": row.get("category", "餐點"),
-                "description": row.get("description", ""),
-                "deadline": to_local_naive(row.get("deadline")),
-                "created_at": to_local_naive(row.get("created_at")),
-                "menu": row.get("menu", []),  # 會在 menu.py 中由 sanitize_menu_dataframe 處理
-                "orders": orders,
-                "menu_image_bytes": image_bytes,
-            })
-        return groups
-    except Exception as e:
-        st.warning(f"載入團購資料時發生錯誤: {e}")
-        return []
+    """載入所有團購（不含訂單，訂單依需要分頁或彙總查詢）"""
+    return _run_async(adb_load_groups())
+
+
+# 本程序最近一次存入本機快照的資料版本號（全部由共用快取取得、版本號相同時不必重複儲存）
+_snapshot_versions = None
+
+
+async def adb_load_all() -> tuple:
+    """同時載入所有店家與團購（不含訂單），回傳 (vendors, groups, source)
+
+    source 為 "cloud"（雲端或共用快取中的最新資料）、"snapshot"（資料庫無法使用，改用本機快照）或 "empty"。
+    有查詢資料庫、或載入的版本與上次存入快照的不同時（例如全部由其他副本寫入的共用快取取得），一併更新本機快照。
+    """
+    global _snapshot_versions
+    catalog, versions, fetched = await _aload_catalog(("vendors", "groups"))
+    if catalog is not None:
+        if fetched or versions != _snapshot_versions:
+            try:
+                snapshot.save_snapshot(catalog)
+                _snapshot_versions = versions
+            except OSError as e:
+                st.warning(f"無法儲存本機快照: {e}")
+        source = "cloud"
+    else:
+        catalog = snapshot.load_snapshot()
+        source = "snapshot" if catalog is not None else "empty"
+    catalog = catalog or {}
+    return _catalog_vendors(catalog), _catalog_groups(catalog), source
+
+
+def db_load_all() -> tuple:
+    """同時載入所有店家與團購（不含訂單），回傳 (vendors, groups, source)"""
+    vendors, groups, source = _run_async(adb_load_all())
+    if source == "cloud":
+        _start_archive_thread()
+    return vendors, groups, source
 
 
 def db_delete_group(group_id: str) -> bool:
     """刪除一筆團購（連帶訂單會由 CASCADE 自動刪除）"""
-    try:
-        client = _get_supabase_client()
-        client.table("groups").delete().eq("id", group_id).execute()
-        return True
-    except Exception as e:
-        st.error(f"刪除團購失敗: {e}")
-        return False
-
+    return _write({"table": "groups", "op": "delete", "id": group_id}, "刪除團購失敗")
+
+
+# ==================== 封存 (groups_archive / orders_archive) ====================
+
+# 同一程序只啟動一個背景封存執行緒（使用自己的客戶端，不依賴 session_state，也不佔用使用者的重跑時間）
+_archive_thread = None
+_archive_thread_lock = threading.Lock()
+_archive_last_error = None
+
+
+def _start_archive_thread() -> None:
+    global _archive_thread
+    if ARCHIVE_AFTER_DAYS <= 0 or ARCHIVE_CHECK_INTERVAL_SECONDS <= 0:
+        return
+    with _archive_thread_lock:
+        if _archive_thread is None:
+            url, key = _get_supabase_credentials()
+            client = create_client(url, key, options=ClientOptions(postgrest_client_timeout=DB_TIMEOUT_SECONDS))
+            _archive_thread = threading.Thread(target=_archive_loop, args=(client,), name="group-archiver", daemon=True)
+            _archive_thread.start()
+
+
+def _archive_loop(client: Client) -> None:
+    """每隔 ARCHIVE_CHECK_INTERVAL_SECONDS 封存一次（多個副本同時執行也不會重複搬移）
+
+    封存後共用快取版本號會改變，各 session 下次重跑即改為載入封存後的資料。
+    """
+    global _archive_last_error
+    while True:
+        if _breaker.allow():
+            try:
+                archived = client.rpc("archive_closed_groups", {"p_days": ARCHIVE_AFTER_DAYS}).execute().data
+            except Exception as e:
+                if _is_connection_error(e):
+                    _breaker.record_failure()
+                else:
+                    _breaker.record_success()
+                _archive_last_error = f"{datetime.now():%Y-%m-%d %H:%M} {e}"
+            else:
+                _breaker.record_success()
+                _archive_last_error = None
+                if archived:
+                    shared_cache.invalidate("groups")
+        time.sleep(ARCHIVE_CHECK_INTERVAL_SECONDS)
+
+
+def db_archive_old_groups(days: int = ARCHIVE_AFTER_DAYS):
+    """將收單超過 days 天的團購連同訂單搬到封存表，回傳封存的團購數；資料庫無法使用時回傳 None"""
+    if int(days) < 1:
+        st.error("封存天數至少為 1 天")
+        return None
+    archived = _read(
+        lambda client: client.rpc("archive_closed_groups", {"p_days": int(days)}),
+        "封存舊團購失敗",
+    )
+    if archived:
+        shared_cache.invalidate("groups")
+    return archived
+
+
+def db_load_archived_groups(query: str = "", limit: int = 100):
+    """載入已封存的團購（不含菜單圖片與訂單，新的在前），query 比對店家名稱；資料庫無法使用時回傳 None"""
+
+    def build_query(client):
+        q = client.table("groups_archive").select(
+            "id,vendor_name,category,description,deadline,created_at,archived_at"
+        )
+        if query.strip():
+            q = q.ilike("vendor_name", f"*{query.strip()}*")
+        return q.order("deadline", desc=True).limit(limit)
+
+    rows = _read(build_query, "載入封存團購失敗")
+    if rows is None:
+        return None
+    return [dict(_row_to_group(row), archived_at=to_local_naive(row.get("archived_at"))) for row in rows]
+
+
+def db_load_archived_orders(group_id: str):
+    """載入某個已封存團購的所有訂單；資料庫無法使用時回傳 None"""
+    rows = _read(
+        lambda client: client.table("orders_archive").select("*").eq("group_id", group_id).order("ordered_at").order("id"),
+        "載入封存訂單失敗",
+    )
+    if rows is None:
+        return None
+    return [_row_to_order(row) for row in rows]
+
+
+# ==================== 定期開團範本 (group_templates) ====================
+
+def _row_to_template(row: dict) -> dict:
+    """將 group_templates 資料列轉換為範本 dict（deadline_time 為 datetime.time）"""
+    return {
+        "id": row["id"],
+        "vendor_id": row.get("vendor_id", ""),
+        "weekday": int(row.get("weekday", 0)),
+        "deadline_time": datetime.strptime(str(row.get("deadline_time", "00:00"))[:5], "%H:%M").time(),
+        "description": row.get("description", ""),
+    }
+
+
+def db_save_template(template: dict) -> bool:
+    """儲存或更新一筆定期開團範本"""
+    row = {
+        "id": template["id"],
+        "vendor_id": template["vendor_id"],
+        "weekday": int(template["weekday"]),
+        "deadline_time": template["deadline_time"].strftime("%H:%M"),
+        "description": template.get("description", ""),
+    }
+    return _write({"table": "group_templates", "op": "upsert", "row": row}, "儲存定期開團範本失敗")
+
+
+def db_load_templates() -> list:
+    """載入所有定期開團範本"""
+    rows = _read(
+        lambda client: client.table("group_templates").select("*").order("weekday").order("deadline_time"),
+        "載入定期開團範本失敗",
+    )
+    return [_row_to_template(row) for row in rows or []]
+
+
+def db_delete_template(template_id: str) -> bool:
+    """刪除一筆定期開團範本（已建立的團購會保留）"""
+    return _write({"table": "group_templates", "op": "delete", "id": template_id}, "刪除定期開團範本失敗")
+
+
+def db_create_groups_from_templates(occurrences: int):
+    """依所有範本一次批次建立接下來 occurrences 次的團購（菜單與圖片在資料庫內直接從店家複製）
+
+    回傳新建立的團購數（已存在的場次會略過）；資料庫無法使用時回傳 None。
+    """
+    created = _read(
+        lambda client: client.rpc("create_groups_from_templates", {"p_occurrences": int(occurrences)}),
+        "建立定期團購失敗",
+    )
+    if created:
+        shared_cache.invalidate("groups")
+    return created
 
 # ==================== 訂單 (orders) ====================
 
 def db_save_order(group_id: str, order: dict) -> bool:
     """儲存一筆訂單"""
     try:
-        client = _get_supabase_client()
         import uuid
 
         row = {
-            "id": str(uuid.uuid4()),
+            "id": order.get("id") or str(uuid.uuid4()),
             "group_id": group_id,
             "user_name": order.get("姓名", ""),
             "item_name": order.get("品項", ""),
+            "sugar": order.get("甜度", ""),
+            "ice": order.get("冰塊", ""),
+            "options": order.get("選項", {}),
             "unit_price": float(order.get("單價", 0)),
             "quantity": int(order.get("數量", 1)),
             "total_price": float(order.get("總價", 0)),
             "note": order.get("備註", ""),
             "ordered_at": order.get("下單時間", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
         }
-
-        client.table("orders").insert(row).execute()
-        return True
     except Exception as e:
         st.error(f"儲存訂單失敗: {e}")
         return False
+
+    apply = _submit_order_to_batch if ORDER_BATCH_WINDOW_MS > 0 else None
+    return _write({"table": "orders", "op": "insert", "row": row}, "儲存訂單失敗", apply=apply)
+
+
+
+def db_update_order(group_id: str, order_id: str, order: dict) -> bool:
+    """更新一筆訂單的品項、客製化選項、數量與備註"""
+    try:
+        row = {
+            "item_name": order.get("品項", ""),
+            "sugar": order.get("甜度", ""),
+            "ice": order.get("冰塊", ""),
+            "options": order.get("選項", {}),
+            "unit_price": float(order.get("單價", 0)),
+            "quantity": int(order.get("數量", 1)),
+            "total_price": float(order.get("總價", 0)),
+            "note": order.get("備註", ""),
+        }
+    except Exception as e:
+        st.error(f"更新訂單失敗: {e}")
+        return False
+
+    return _write({"table": "orders", "op": "update", "id": order_id, "group_id": group_id, "row": row}, "更新訂單失敗")
+
+
+def db_delete_order(group_id: str, order_id: str) -> bool:
+    """取消（刪除）一筆訂單"""
+    return _write({"table": "orders", "op": "delete", "id": order_id, "group_id": group_id}, "取消訂單失敗")
+
+
+def db_load_group_orders(group_id: str):
+    """載入單一團購的所有訂單（匯出 CSV 或資料庫無法彙總時才需要）；資料庫無法使用時回傳 None"""
+    rows = _read(
+        lambda client: client.table("orders").select("*").eq("group_id", group_id).order("ordered_at").order("id"),
+        "載入訂單失敗",
+    )
+    if rows is None:
+        return None
+    return [_row_to_order(row) for row in rows]
+
+
+def db_load_user_orders(group_id: str, user_name: str):
+    """載入某位團員在某團購的所有訂單（使用 (group_id, user_name) 索引）；資料庫無法使用時回傳 None"""
+    rows = _read(
+        lambda client: client.table("orders").select("*")
+        .eq("group_id", group_id).eq("user_name", user_name)
+        .order("ordered_at").order("id"),
+        "載入我的訂單失敗",
+    )
+    if rows is None:
+        return None
+    return [_row_to_order(row) for row in rows]
+
+def db_load_order_summary(group_id: str):
+    """在資料庫端依品項、甜度、冰塊、其他選項與備註彙總某團購（含已封存）的訂單；資料庫無法使用時回傳 None
+
+    彙總結果依該團購的訂單版本號存在共用快取，只有這個團購的訂單異動後才會重新查詢。
+    """
+    scope = shared_cache.orders_scope(group_id)
+    versions = shared_cache.versions((scope,))
+    rows = shared_cache.get(scope, versions[0]) if versions is not None else None
+    if rows is None:
+        rows = _read(lambda client: client.rpc("order_summary", {"p_group_id": group_id}), "載入叫貨單失敗")
+        if rows is None:
+            return None
+        if versions is not None:
+            shared_cache.put(scope, versions[0], rows)
+    return [
+        {
+            "品項": row.get("item_name", ""),
+            "甜度": row.get("sugar") or "",
+            "冰塊": row.get("ice") or "",
+            "選項": row.get("options") or {},
+            "備註": row.get("note") or "",
+            "數量": row.get("quantity", 0),
+            "總價": row.get("total_price", 0),
+        }
+        for row in rows
+    ]
+
+
+# 訂單列表允許排序的欄位（皆有 (group_id, 欄位, id) 複合索引，見 setup_db.sql）
+ORDER_SORT_COLUMNS = ("ordered_at", "user_name", "item_name", "total_price")
+
+
+def _pgrst_quote(value) -> str:
+    """將值以雙引號包起來，讓逗號、括號等保留字元可以用在 PostgREST 的 or/and 過濾語法中"""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def db_load_orders_page(group_id: str, query: str = "", sort_by: str = "ordered_at",
+                        descending: bool = False, after=None, limit: int = 50) -> tuple:
+    """以 keyset pagination 載入一頁訂單（過濾與排序都在資料庫端進行）
+
+    query 會比對姓名、品項、甜度、冰塊與備註；after 為上一頁最後一筆的游標 (排序欄位值, id)，第一頁傳 None。
+    回傳 (orders, next_cursor)，next_cursor 為 None 表示沒有下一頁；資料庫無法使用時回傳 (None, None)。
+    """
+    if sort_by not in ORDER_SORT_COLUMNS:
+        raise ValueError(f"不支援的排序欄位: {sort_by}")
+
+    conditions = []
+    keyword = query.strip()
+    if keyword:
+        pattern = _pgrst_quote(f"*{keyword}*")
+        conditions.append(
+            f"or(user_name.ilike.{pattern},item_name.ilike.{pattern},sugar.ilike.{pattern},"
+            f"ice.ilike.{pattern},note.ilike.{pattern})"
+        )
+    if after is not None:
+        # 從游標之後繼續：排序欄位超過游標值，或相同值但 id 超過游標 id
+        op = "lt" if descending else "gt"
+        last_value, last_id = _pgrst_quote(after[0]), _pgrst_quote(after[1])
+        conditions.append(f"or({sort_by}.{op}.{last_value},and({sort_by}.eq.{last_value},id.{op}.{last_id}))")
+
+    def build_query(client):
+        q = client.table("orders").select("*").eq("group_id", group_id)
+        if conditions:
+            q = q.or_(f"and({','.join(conditions)})")
+        # 多取一筆用來判斷是否還有下一頁
+        return q.order(sort_by, desc=descending).order("id", desc=descending).limit(limit + 1)
+
+    rows = _read(build_query, "載入訂單失敗")
+    if rows is None:
+        return None, None
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][sort_by], rows[-1]["id"])
+    return [_row_to_order(row) for row in rows], next_cursor
@@ -3,48 +3,50 @@ import pandas as pd
 from datetime import datetime
 import uuid
 import io
+import time
 import re
 import base64
 from db import (
     db_save_vendor, db_load_vendors, db_delete_vendor,
-    db_save_group, db_load_groups,
-    db_save_order,
-    TAIWAN_TZ,
+    db_save_group,
+    db_load_all, db_load_snapshot,
+    db_save_order, db_load_orders_page, db_load_group_orders,
+    db_load_user_orders, db_update_order, db_delete_order, db_load_order_summary,
+    db_save_template, db_load_templates, db_delete_template,
+    db_create_groups_from_templates,
+    db_archive_old_groups, db_load_archived_groups, db_load_archived_orders,
+    db_flush_pending_writes, db_status, db_order_writer_stats,
+    db_remember_catalog_version, db_catalog_changed, db_invalidate_catalog,
+    ARCHIVE_AFTER_DAYS,
 )
+from menu_utils import (
+    MENU_COLUMNS, MENU_SECTION_COLUMN, CATEGORY_OPTIONS,
+    SUGAR_OPTION_NAME, ICE_OPTION_NAME,
+    now_tw, create_empty_menu_df, is_group_active,
+    normalize_text, normalize_vendor_name, format_price,
+    sanitize_menu_dataframe, vendor_matches_query,
+    parse_option_sets, format_option_sets, get_option_sets, get_order_option,
+    missing_required_options, option_fields, tidy_option_columns,
+    normalize_loaded_vendor, normalize_loaded_group,
+    get_group_options, add_group_option, find_vendor_by_name,
+    orders_to_dataframe, summarize_orders, index_menu, search_menu_index,
+)
+import profiler
 
 
-def now_tw() -> datetime:
-    """取得台灣本地時間（無時區標記的 naive datetime）"""
-    return datetime.now(TAIWAN_TZ).replace(tzinfo=None)
-
 # 設定頁面配置
 st.set_page_config(page_title="多功能團購系統", layout="wide", page_icon="🍱")
 
-MENU_COLUMNS = ["品名", "價格"]
-CATEGORY_OPTIONS = ["餐點", "飲料", "其他"]
-
-
-def create_empty_menu_df():
-    return pd.DataFrame(columns=MENU_COLUMNS)
-
-
-def is_group_active(group):
-    return group['deadline'] > now_tw()
-
-
-def normalize_text(value):
-    if value is None:
-        return ""
-    return str(value).strip()
-
-
-def normalize_vendor_name(name):
-    return normalize_text(name).casefold()
+# 效能分析模式（🔧 系統資訊 或環境變數 MENU_PROFILE 開啟）：記錄整次重跑，於腳本最後收尾
+profiler.begin_rerun()
 
+ORDER_SORT_OPTIONS = {"下單時間": "ordered_at", "姓名": "user_name", "品項": "item_name", "總價": "total_price"}
+ORDER_PAGE_SIZES = [25, 50, 100]
+WEEKDAY_LABELS = ["週一", "週二", "週三", "週四", "週五", "週六", "週日"]
+AUTO_REFRESH_OPTIONS = {"關閉": None, "每 10 秒": 10, "每 30 秒": 30, "每 60 秒": 60}
+TIME_PATTERN = r"^(?:[01]?\d|2[0-3]):[0-5]\d$"
 
-def format_price(value):
-    price = float(value)
-    return str(int(price)) if price.is_integer() else f"{price:g}"
+OPTION_SETS_PLACEHOLDER = "每行一組，例如：\n甜度：正常糖、半糖、無糖\n冰塊：正常冰、少冰、去冰\n加料：珍珠、椰果"
 
 
 @st.cache_data
@@ -53,14 +55,14 @@ def build_menu_template_excel():
 
     template_df = pd.DataFrame(
         [
-            {"品名": "範例:珍珠奶茶", "價格": 50},
-            {"品名": "範例:招牌便當", "價格": 100},
+            {"品名": "範例:珍珠奶茶", "價格": 50, "分區": "奶茶"},
+            {"品名": "範例:招牌便當", "價格": 100, "分區": "便當"},
         ]
     )
     note_df = pd.DataFrame(
         {
-            "欄位": ["品名", "價格"],
-            "說明": ["請填寫餐點或飲料名稱", "請填寫數字價格，不要加 $ 符號"],
+            "欄位": ["品名", "價格", "分區"],
+            "說明": ["請填寫餐點或飲料名稱", "請填寫數字價格，不要加 $ 符號", "選填：菜單分區，點餐時可依分區篩選"],
         }
     )
 
@@ -72,42 +74,27 @@ def build_menu_template_excel():
     return output.getvalue()
 
 
-def sanitize_menu_dataframe(menu_data):
-    df = pd.DataFrame(menu_data).copy()
-
-    for column in MENU_COLUMNS:
-        if column not in df.columns:
-            df[column] = pd.NA
-
-    df = df[MENU_COLUMNS]
-    df["品名"] = df["品名"].astype("string").fillna("").str.strip()
-    df["價格"] = pd.to_numeric(df["價格"], errors="coerce")
-    df = df[(df["品名"] != "") & df["價格"].notna()].copy()
-
-    if df.empty:
-        return create_empty_menu_df()
-
-    df["價格"] = df["價格"].apply(lambda price: int(price) if float(price).is_integer() else float(price))
-    return df.reset_index(drop=True)
-
-
-def vendor_matches_query(vendor, query):
-    keywords = [part.casefold() for part in normalize_text(query).split() if part.strip()]
-    if not keywords:
-        return True
-
-    menu_items = []
-    if "品名" in vendor["menu"].columns:
-        menu_items = vendor["menu"]["品名"].astype(str).tolist()
-
-    haystack_parts = [
-        vendor.get("vendor_name", ""),
-        vendor.get("category", ""),
-        vendor.get("description", ""),
-        *menu_items,
-    ]
-    haystack = " ".join(normalize_text(part) for part in haystack_parts).casefold()
-    return all(keyword in haystack for keyword in keywords)
+@st.cache_data(max_entries=128, show_spinner=False)
+def build_menu_index(menu_df):
+    """建立點餐用的菜單索引（見 menu_utils.index_menu）；以 st.cache_data 依菜單內容快取，每個菜單版本只計算一次"""
+    return index_menu(menu_df)
+
+
+def render_option_inputs(option_sets, key_prefix, order=None):
+    """依選項清單顯示下拉選單（order 為目前的選擇），回傳 {選項名稱: 選擇}，未選擇為空字串"""
+    selections = {}
+    columns = st.columns(2) if option_sets else []
+    for i, option_set in enumerate(option_sets):
+        name = option_set['name']
+        placeholder = "(請選擇)" if name in (SUGAR_OPTION_NAME, ICE_OPTION_NAME) else "(不需要)"
+        choices = [placeholder] + option_set['choices']
+        current = get_order_option(order, name) if order else ""
+        with columns[i % 2]:
+            choice = st.selectbox(
+                name, choices, index=choices.index(current) if current in choices else 0, key=f"{key_prefix}_{name}"
+            )
+        selections[name] = "" if choice == placeholder else choice
+    return selections
 
 # --- 資料持久化函式（Supabase 雲端） ---
 def save_vendor_to_cloud(vendor):
@@ -125,30 +112,27 @@ def save_order_to_cloud(group_id, order):
     return db_save_order(group_id, order)
 
 
+def apply_loaded_data(vendors_raw, groups_raw):
+    """正規化載入的店家與團購資料並放入 session_state"""
+    st.session_state.vendors = [normalize_loaded_vendor(v) for v in vendors_raw]
+    st.session_state.groups = [normalize_loaded_group(g) for g in groups_raw]
+
+
 def load_data():
-    """從 Supabase 雲端資料庫載入所有資料"""
+    """從 Supabase 雲端資料庫載入所有資料（資料庫無法連線時改用本機快照）"""
     try:
-        # 載入店家
-        vendors_raw = db_load_vendors()
-        st.session_state.vendors = []
-        for v in vendors_raw:
-            v['vendor_name'] = normalize_text(v.get('vendor_name'))
-            v['category'] = normalize_text(v.get('category')) or CATEGORY_OPTIONS[0]
-            v['description'] = normalize_text(v.get('description'))
-            v['menu'] = sanitize_menu_dataframe(v.get('menu', []))
-            st.session_state.vendors.append(v)
-
-        # 載入團購（含訂單）
-        groups_raw = db_load_groups()
-        st.session_state.groups = []
-        for g in groups_raw:
-            g['vendor_name'] = normalize_text(g.get('vendor_name'))
-            g['category'] = normalize_text(g.get('category')) or CATEGORY_OPTIONS[0]
-            g['description'] = normalize_text(g.get('description'))
-            g['menu'] = sanitize_menu_dataframe(g.get('menu', []))
-            st.session_state.groups.append(g)
-
-        return True
+        # 先送出離線期間暫存的寫入，載入的資料才會包含它們
+        db_flush_pending_writes()
+
+        # 先記下共用快取版本號，載入期間若有其他寫入，下次重跑會再載入一次
+        db_remember_catalog_version()
+        # 店家與團購同時載入（訂單在訂單管理頁依需要分頁或彙總查詢）
+        vendors_raw, groups_raw, source = db_load_all()
+        apply_loaded_data(vendors_raw, groups_raw)
+        # 定期開團範本在店家管理頁用到時才重新載入
+        st.session_state.pop('templates', None)
+        st.session_state.data_source = source
+        return source == "cloud"
     except Exception as e:
         st.warning(f"載入雲端資料時發生錯誤: {e}")
         return False
@@ -162,50 +146,413 @@ if 'initialized' not in st.session_state:
     })
     st.session_state.vendors = []
     st.session_state.groups = []
+    st.session_state.data_source = "empty"
+
+    # 有本機快照時先用快照立即顯示畫面，頁面送出後再同步雲端最新資料（見檔案最後）
+    snapshot_data = db_load_snapshot()
+    if snapshot_data is not None:
+        apply_loaded_data(*snapshot_data)
+        st.session_state.data_source = "snapshot"
+        st.session_state['_refresh_after_render'] = True
+    else:
+        load_data()
+
+# --- 其他 session 或副本改過店家或團購後（共用快取版本號改變）重新載入，新資料多半已在共用快取中 ---
+# 載入超過共用快取的存活時間也會重新載入（看到排程或 SQL 直接修改的資料）；
+# 訂單異動只會讓該團購的訂單彙總失效，不會觸發整份重新載入
+elif st.session_state.data_source == "cloud" and db_catalog_changed():
     load_data()
 
 # --- 輔助函式 ---
-def get_group_options():
-    options = {}
-    sorted_groups = sorted(
-        st.session_state.groups,
-        key=lambda group: (not is_group_active(group), group['deadline'])
-    )
-
-    for group in sorted_groups:
-        status = "🟢進行中" if is_group_active(group) else "🔴已截止"
-        deadline_label = group['deadline'].strftime('%Y-%m-%d %H:%M')
-        base_label = f"{status} | {group['vendor_name']} ({group['category']}) | 收單 {deadline_label}"
-        label = base_label
-        duplicate_index = 2
-        while label in options:
-            label = f"{base_label} #{duplicate_index}"
-            duplicate_index += 1
-        options[label] = group['id']
-    return options
-
 def get_group_by_id(group_id):
     for group in st.session_state.groups:
         if group['id'] == group_id:
             return group
     return None
 
-def find_vendor_by_name(name):
-    target = normalize_vendor_name(name)
-    for v in st.session_state.vendors:
-        if normalize_vendor_name(v['vendor_name']) == target:
-            return v
-    return None
-
 def load_vendor_into_group_form(vendor):
     """將店家資料帶入開團表單的 session_state"""
     st.session_state.current_menu_editor = vendor['menu'].copy()
     st.session_state['_grp_vendor_name'] = vendor['vendor_name']
     st.session_state['_grp_category'] = vendor['category']
     st.session_state['_grp_description'] = vendor['description']
+    st.session_state['_grp_option_sets'] = format_option_sets(vendor['option_sets'])
     st.session_state['_grp_loaded_vendor_id'] = vendor['id']
     st.session_state['_grp_menu_image_bytes'] = vendor.get('menu_image_bytes')
 
+def render_my_orders(group):
+    """我的訂單：依姓名查詢自己在此團的訂單，截止前可修改或取消"""
+    st.markdown("---")
+    st.subheader("🧾 我的訂單")
+    my_name = normalize_text(st.text_input("輸入姓名查詢自己的訂單", key=f"my_orders_name_{group['id']}"))
+    if not my_name:
+        return
+
+    my_orders = db_load_user_orders(group['id'], my_name)
+    if my_orders is None:
+        st.warning("⚠️ 雲端資料庫暫時無法連線，無法查詢您的訂單。")
+        return
+    if not my_orders:
+        st.info("查無您的訂單。")
+        return
+
+    editable = is_group_active(group)
+    if not editable:
+        st.caption("此團已截止，訂單僅供查看。")
+
+    menu_index = build_menu_index(group['menu'])
+    item_names = menu_index['names']
+    option_sets = get_option_sets(group)
+    for order in my_orders:
+        with st.expander(f"{order['品項']} × {order['數量']}　${format_price(order['總價'])}", expanded=False):
+            chosen_options = [get_order_option(order, o['name']) for o in option_sets]
+            options_label = "、".join(choice for choice in chosen_options if choice)
+            st.caption(
+                f"下單時間：{order['下單時間']}"
+                + (f"　選項：{options_label}" if options_label else "")
+                + f"　備註：{order['備註'] or '（無）'}"
+            )
+            if not editable or not order.get('id') or not item_names:
+                continue
+
+            with st.form(key=f"edit_order_{order['id']}"):
+                new_item_index = st.selectbox(
+                    "餐點",
+                    options=menu_index['order'],
+                    index=menu_index['order'].index(item_names.index(order['品項'])) if order['品項'] in item_names else 0,
+                    format_func=menu_index['labels'].__getitem__,
+                )
+                new_selections = render_option_inputs(option_sets, f"edit_option_{order['id']}", order)
+                new_quantity = st.number_input("數量", min_value=1, value=int(order['數量']))
+                new_note = st.text_input("備註", value=order['備註'])
+                c_save, c_cancel = st.columns(2)
+                with c_save:
+                    save = st.form_submit_button("💾 更新訂單")
+                with c_cancel:
+                    cancel = st.form_submit_button("🗑️ 取消訂單")
+
+            if save and missing_required_options(option_sets, new_selections):
+                missing = missing_required_options(option_sets, new_selections)
+                st.error(f"❌ 請務必選擇{'與'.join(f'「{name}」' for name in missing)}！")
+            elif save:
+                item_price = float(menu_index['prices'][new_item_index])
+                item_price = int(item_price) if item_price.is_integer() else item_price
+                updated_order = {
+                    **order,
+                    "品項": item_names[new_item_index],
+                    **option_fields(new_selections),
+                    "單價": item_price,
+                    "數量": int(new_quantity),
+                    "總價": item_price * int(new_quantity),
+                    "備註": normalize_text(new_note),
+                }
+                if db_update_order(group['id'], order['id'], updated_order):
+                    st.toast("✅ 訂單已更新")
+                    rerun_fragment()
+            elif cancel:
+                if db_delete_order(group['id'], order['id']):
+                    st.toast("🗑️ 訂單已取消")
+                    rerun_fragment()
+
+def render_order_list_page(group):
+    """詳細訂單列表：由資料庫分頁載入，只保留目前這一頁"""
+    f1, f2, f3, f4 = st.columns([3, 2, 1, 1])
+    with f1:
+        order_query = st.text_input("搜尋訂單", placeholder="可搜尋姓名、品項、甜度、冰塊或備註", key=f"order_query_{group['id']}")
+    with f2:
+        sort_label = st.selectbox("排序欄位", list(ORDER_SORT_OPTIONS), key=f"order_sort_{group['id']}")
+    with f3:
+        page_size = st.selectbox("每頁筆數", ORDER_PAGE_SIZES, key=f"order_page_size_{group['id']}")
+    with f4:
+        sort_desc = st.checkbox("由大到小", key=f"order_sort_desc_{group['id']}")
+
+    # 搜尋或排序條件改變時回到第一頁；cursors 記錄每一頁的起始游標
+    view_key = (group['id'], normalize_text(order_query), sort_label, sort_desc, page_size)
+    page_state = st.session_state.setdefault('_order_page_state', {})
+    if page_state.get('view') != view_key:
+        page_state.clear()
+        page_state.update(view=view_key, cursors=[None])
+    cursors = page_state['cursors']
+
+    page_orders, next_cursor = db_load_orders_page(
+        group['id'],
+        query=normalize_text(order_query),
+        sort_by=ORDER_SORT_OPTIONS[sort_label],
+        descending=sort_desc,
+        after=cursors[-1],
+        limit=page_size,
+    )
+    if page_orders is None:
+        st.warning("⚠️ 雲端資料庫暫時無法連線，無法載入訂單列表。")
+        return
+
+    if page_orders:
+        st.dataframe(orders_to_dataframe(page_orders), use_container_width=True)
+    else:
+        st.info("沒有符合條件的訂單。")
+
+    nav1, nav2, nav3 = st.columns([1, 2, 1])
+    with nav1:
+        if st.button("⬅️ 上一頁", key=f"order_prev_{group['id']}", disabled=len(cursors) == 1):
+            cursors.pop()
+            rerun_fragment()
+    with nav2:
+        st.caption(f"第 {len(cursors)} 頁")
+    with nav3:
+        if st.button("下一頁 ➡️", key=f"order_next_{group['id']}", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            rerun_fragment()
+
+def auto_refresh_control(key):
+    """在片段外顯示自動更新間隔選單，回傳秒數（None 表示不自動更新）"""
+    _, col = st.columns([3, 1])
+    with col:
+        label = st.selectbox("🔄 自動更新", list(AUTO_REFRESH_OPTIONS), key=f"auto_refresh_{key}")
+    return AUTO_REFRESH_OPTIONS[label]
+
+def refresh_due(control_key, data_key):
+    """該片段已開啟自動更新，且 data_key 距上次重新載入已超過設定的間隔時回傳 True"""
+    interval = AUTO_REFRESH_OPTIONS.get(st.session_state.get(f"auto_refresh_{control_key}"))
+    if not interval:
+        return False
+    last_refresh = st.session_state.setdefault('_last_refresh', {})
+    now = time.monotonic()
+    if now - last_refresh.get(data_key, 0) < interval:
+        return False
+    last_refresh[data_key] = now
+    return True
+
+def rerun_fragment():
+    """片段重跑中只重跑目前片段；若是整頁重跑（例如片段外觸發）則重跑整頁"""
+    try:
+        profiler.rerun(scope="fragment")
+    except st.errors.StreamlitAPIException:
+        profiler.rerun()
+
+def run_fragment(render, run_every, *args):
+    """以 st.fragment 執行 render：片段內的互動只重跑這一段，run_every 秒數讓片段自行定時重跑"""
+    st.fragment(run_every=run_every)(render)(*args)
+
+def render_vendor_list():
+    """已儲存的店家列表（片段）：開啟自動更新時定時重新載入店家"""
+    if refresh_due("vendor_list", "vendors"):
+        st.session_state.vendors = [normalize_loaded_vendor(v) for v in db_load_vendors()]
+
+    st.subheader("📋 已儲存的店家")
+    vendor_query = st.text_input(
+        "搜尋店家",
+        placeholder="可搜尋店名、分類、備註或菜單品項",
+        key="vendor_search_query",
+    )
+
+    if not st.session_state.vendors:
+        st.info("尚無店家資料，請先在上方新增店家。")
+    else:
+        filtered_vendors = [
+            (i, vendor) for i, vendor in enumerate(st.session_state.vendors)
+            if vendor_matches_query(vendor, vendor_query)
+        ]
+        st.caption(f"符合搜尋結果：{len(filtered_vendors)} / {len(st.session_state.vendors)} 間")
+
+        if not filtered_vendors:
+            st.warning("找不到符合條件的店家，請換個關鍵字試試看。")
+
+        for i, vendor in filtered_vendors:
+            with st.expander(f"🏪 {vendor['vendor_name']}  ·  {vendor['category']}", expanded=False):
+                st.caption(f"說明：{vendor['description'] or '（無）'}")
+                if vendor['option_sets']:
+                    st.caption("客製化選項：" + "；".join(format_option_sets(vendor['option_sets']).splitlines()))
+                st.dataframe(vendor['menu'], use_container_width=True)
+                if vendor.get('menu_image_bytes'):
+                    st.image(io.BytesIO(vendor['menu_image_bytes']), caption="菜單圖片", use_container_width=True)
+                btn_c1, btn_c2 = st.columns(2)
+                with btn_c1:
+                    if st.button(f"🚀 直接開團", key=f"quick_group_{vendor['id']}"):
+                        load_vendor_into_group_form(vendor)
+                        st.session_state['_goto_page'] = "我要開團 (團主)"
+                        profiler.rerun()
+                with btn_c2:
+                    if st.button(f"🗑️ 刪除", key=f"del_vendor_{vendor['id']}"):
+                        st.session_state.vendors.pop(i)
+                        db_delete_vendor(vendor['id'])
+                        profiler.rerun()
+
+def render_order_form(group_id):
+    """點餐表單與我的訂單（片段）：搜尋、送出訂單不會重跑整頁；開啟自動更新時定時刷新剩餘時間"""
+    group = get_group_by_id(group_id)
+    if group is None:
+        return
+
+    time_left = group['deadline'] - now_tw()
+    if time_left.total_seconds() <= 0:
+        st.error("⛔ 這團已經截止收單囉！")
+    else:
+        time_str = str(time_left).split('.')[0]
+        st.success(f"🟢 開放點餐中 (剩餘 {time_str})")
+
+        # 搜尋與分區篩選放在表單外，輸入後即時縮小選單，只顯示符合的品項
+        menu_index = build_menu_index(group['menu'])
+        s_col1, s_col2 = st.columns([2, 1])
+        with s_col1:
+            menu_query = st.text_input(
+                "🔍 搜尋餐點", placeholder="輸入品名開頭、關鍵字或簡稱（例如：珍奶）", key=f"menu_query_{group['id']}"
+            )
+        with s_col2:
+            menu_section = None
+            if menu_index['sections']:
+                section_choice = st.selectbox(
+                    "分區", ["全部"] + list(menu_index['sections']), key=f"menu_section_{group['id']}"
+                )
+                menu_section = None if section_choice == "全部" else section_choice
+        matched_items = search_menu_index(menu_index, menu_query, menu_section)
+        if not matched_items:
+            st.caption("找不到符合的餐點，請換個關鍵字。")
+
+        with st.form(key=f"form_{group['id']}"):
+            user_name = st.text_input("您的姓名 (必填)")
+
+            selected_item_index = st.selectbox(
+                f"選擇餐點（符合 {len(matched_items)} / {len(menu_index['names'])} 項）",
+                options=[-1] + matched_items,
+                format_func=lambda idx: "(請選擇)" if idx == -1 else menu_index['labels'][idx],
+                key=f"menu_select_{group['id']}"
+            )
+
+            option_sets = get_option_sets(group)
+            if option_sets:
+                st.markdown("**🍹 客製化選項**")
+            option_selections = render_option_inputs(option_sets, f"option_{group['id']}")
+
+            col_q1, col_q2 = st.columns(2)
+            with col_q1:
+                quantity = st.number_input("數量", min_value=1, value=1, key=f"qty_{group['id']}")
+            with col_q2:
+                note = st.text_input("其他備註 (例如：加珍珠)", key=f"note_{group['id']}")
+
+            submit = st.form_submit_button("送出訂單")
+
+            if submit:
+                if not normalize_text(user_name):
+                    st.error("❌ 請輸入姓名！")
+                elif selected_item_index == -1:
+                    st.error("❌ 請選擇一項餐點！")
+                elif missing_required_options(option_sets, option_selections):
+                    missing = missing_required_options(option_sets, option_selections)
+                    st.error(f"❌ 請務必選擇{'與'.join(f'「{name}」' for name in missing)}！")
+                else:
+                    try:
+                        item_name = menu_index['names'][selected_item_index]
+                        item_price = float(menu_index['prices'][selected_item_index])
+                        item_price = int(item_price) if item_price.is_integer() else item_price
+                        quantity_value = int(quantity)
+
+                        order_entry = {
+                            "id": str(uuid.uuid4()),
+                            "姓名": normalize_text(user_name),
+                            "品項": item_name,
+                            **option_fields(option_selections),
+                            "單價": item_price,
+                            "數量": quantity_value,
+                            "總價": item_price * quantity_value,
+                            "備註": normalize_text(note),
+                            "下單時間": now_tw().strftime("%Y-%m-%d %H:%M:%S")
+                        }
+
+                        if save_order_to_cloud(group['id'], order_entry):
+                            st.success(f"✅ {user_name}，您的「{item_name}」已訂購成功！")
+                            st.info("💾 訂單已儲存到雲端資料庫")
+                        else:
+                            st.warning("⚠️ 訂單未能儲存到雲端，請稍後再試")
+                    except Exception as e:
+                        st.error(f"系統錯誤：{e}")
+
+    render_my_orders(group)
+
+def render_order_stats(group_id):
+    """訂單統計（片段）：列表與統計都直接查詢資料庫，開啟自動更新時定時重跑取得最新資料"""
+    group = get_group_by_id(group_id)
+    if group is None:
+        return
+
+    with st.expander("展開詳細訂單列表", expanded=True):
+        render_order_list_page(group)
+
+    render_order_summary(group, lambda: db_load_group_orders(group_id))
+
+def render_order_summary(group, load_orders):
+    """總金額、廠商叫貨單與 CSV 匯出（進行中與已封存的團購共用）
+
+    總金額與叫貨單由資料庫彙總；load_orders() 取得此團所有訂單，只在匯出 CSV 或資料庫無法彙總時呼叫。
+    """
+    summary_rows = db_load_order_summary(group['id'])
+    if summary_rows is None:
+        # 資料庫無法彙總 → 取得完整訂單在本機彙總
+        orders = load_orders()
+        if orders is None:
+            st.warning("雲端資料庫暫時無法連線，無法計算訂單統計。")
+            return
+        summary_rows = summarize_orders(orders_to_dataframe(orders)).to_dict("records") if orders else []
+    if not summary_rows:
+        st.warning("尚無訂單。")
+        return
+
+    summary = pd.DataFrame(summary_rows)
+    total_money = summary["總價"].sum()
+    total_qty = summary["數量"].sum()
+    st.metric("本團總金額", f"${format_price(total_money)}", delta=f"共 {total_qty} 份餐點")
+
+    st.subheader("📝 廠商叫貨單 (合併相同品項與需求)")
+    st.dataframe(tidy_option_columns(summary.drop(columns=["總價"])), use_container_width=True, hide_index=True)
+
+    # CSV 需要完整訂單，按下後才載入
+    csv_key = f"_orders_csv_{group['id']}"
+    if st.session_state.get(csv_key) is None and st.button("📄 產生訂單 CSV", key=f"prepare_csv_{group['id']}"):
+        orders = load_orders()
+        if orders is None:
+            st.warning("雲端資料庫暫時無法連線，無法匯出訂單。")
+        else:
+            st.session_state[csv_key] = orders_to_dataframe(orders).to_csv(index=False).encode('utf-8-sig')
+    if st.session_state.get(csv_key) is not None:
+        st.download_button(
+            label=f"📥 下載 [{group['vendor_name']}] 訂單 CSV",
+            data=st.session_state[csv_key],
+            file_name=f"orders_{group['vendor_name']}_{group['deadline']:%Y%m%d}.csv",
+            mime='text/csv',
+            key=f"download_csv_{group['id']}",
+            # 下載後即釋放，下次匯出重新載入最新訂單
+            on_click=lambda: st.session_state.pop(csv_key, None),
+        )
+
+def render_archived_groups():
+    """已封存團購的統計與匯出（唯讀，直接查詢封存表）"""
+    keyword = st.text_input("搜尋店家", key="archive_search", placeholder="輸入店家名稱")
+    archived_groups = db_load_archived_groups(keyword)
+    if archived_groups is None:
+        st.warning("雲端資料庫暫時無法連線，無法查詢封存資料。")
+        return
+    if not archived_groups:
+        st.info("沒有符合的封存團購。")
+        return
+
+    options = {}
+    for archived_group in archived_groups:
+        add_group_option(options, "📦已封存", archived_group, archived_group)
+    group = options[st.selectbox("選擇封存團購", list(options.keys()), key="archive_select")]
+
+    st.divider()
+    st.subheader(f"店家：{group['vendor_name']}")
+    st.caption(f"封存時間：{group['archived_at']:%Y-%m-%d %H:%M}")
+    orders = db_load_archived_orders(group['id'])
+    if orders is None:
+        st.warning("雲端資料庫暫時無法連線，無法查詢封存訂單。")
+    elif not orders:
+        st.warning("尚無訂單。")
+    else:
+        df_orders = orders_to_dataframe(orders)
+        with st.expander("展開詳細訂單列表", expanded=False):
+            st.dataframe(df_orders, use_container_width=True, hide_index=True)
+        render_order_summary(group, lambda: orders)
+
 # --- 側邊欄 ---
 st.sidebar.title("🍱 團購導航")
 page_options = ["店家管理", "我要開團 (團主)", "我要點餐 (團員)", "訂單管理 (統計/結算)"]
@@ -221,6 +568,15 @@ if _goto in page_options:
 page = st.sidebar.radio("選擇功能", page_options, key="current_page")
 
 st.sidebar.divider()
+if st.session_state.get('_refresh_after_render'):
+    st.sidebar.caption("⏳ 先顯示上次的資料，正在同步雲端最新資料…")
+elif st.session_state.data_source != "cloud":
+    data_hint = "顯示的是上次儲存的資料" if st.session_state.data_source == "snapshot" else "目前沒有可顯示的資料"
+    write_hint = "新資料會暫存在本機，恢復連線後自動同步" if db_status()["offline_write_mode"] == "queue" else "目前為唯讀模式"
+    st.sidebar.warning(f"⚠️ 雲端資料庫暫時無法連線，{data_hint}。{write_hint}")
+_cache_status = db_status()["cache"]
+if _cache_status["setup_error"]:
+    st.sidebar.warning(f"⚠️ {_cache_status['setup_error']}，其他副本的修改約 {_cache_status['ttl_seconds']} 秒後才會出現")
 st.sidebar.caption(f"🏪 已儲存店家：{len(st.session_state.vendors)} 間")
 active_group_count = sum(1 for group in st.session_state.groups if is_group_active(group))
 if active_group_count:
@@ -243,6 +599,10 @@ if page == "店家管理":
         with col2:
             new_description = st.text_area("說明備註", placeholder="例如:這家很快,要在11點前送單,請大家配合。", key="new_description")
             new_uploaded_image = st.file_uploader("上傳原始菜單圖片 (供點餐者參考)", type=["png", "jpg", "jpeg"], key="new_menu_image")
+        new_option_sets_text = st.text_area(
+            "客製化選項 (選填)", placeholder=OPTION_SETS_PLACEHOLDER, key="new_option_sets",
+            help="點餐時以下拉選單選擇；「甜度」「冰塊」為必選。飲料類未填寫時使用預設的甜度與冰塊選項。",
+        )
 
         st.markdown("**菜單設定 (手動輸入 或 Excel 匯入)**")
 
@@ -262,7 +622,7 @@ if page == "店家管理":
                 try:
                     df_import = pd.read_excel(uploaded_file)
                     if "品名" in df_import.columns and "價格" in df_import.columns:
-                        st.session_state.current_menu_editor = df_import[["品名", "價格"]].copy()
+                        st.session_state.current_menu_editor = df_import[[c for c in [*MENU_COLUMNS, MENU_SECTION_COLUMN] if c in df_import.columns]].copy()
                         st.success(f"讀取成功！共 {len(st.session_state.current_menu_editor)} 筆商品，已載入到下方表格。")
                     else:
                         st.error("Excel 格式錯誤！找不到「品名」或「價格」欄位。")
@@ -281,11 +641,18 @@ if page == "店家管理":
         if st.button("💾 儲存店家", type="primary"):
             normalized_name = normalize_text(new_vendor_name)
             final_menu_df = sanitize_menu_dataframe(st.session_state.current_menu_editor)
+            try:
+                new_option_sets = parse_option_sets(new_option_sets_text)
+                option_sets_error = None
+            except ValueError as e:
+                option_sets_error = str(e)
             if not normalized_name:
                 st.error("❌ 請輸入店家名稱！")
+            elif option_sets_error:
+                st.error(f"❌ 客製化選項{option_sets_error}")
             elif final_menu_df.empty:
                 st.error("❌ 菜單為空！請輸入至少一個品項。")
-            elif find_vendor_by_name(normalized_name):
+            elif find_vendor_by_name(st.session_state.vendors, normalized_name):
                 st.error("❌ 已有相同名稱的店家，請直接使用既有資料或先刪除舊資料。")
             else:
                 image_bytes = new_uploaded_image.getvalue() if new_uploaded_image else None
@@ -295,53 +662,90 @@ if page == "店家管理":
                     "category": new_category,
                     "description": normalize_text(new_description),
                     "menu": final_menu_df,
+                    "option_sets": new_option_sets,
                     "menu_image_bytes": image_bytes,
                 }
                 st.session_state.vendors.append(new_vendor)
                 if save_vendor_to_cloud(new_vendor):
                     st.success(f"✅ 店家「{normalized_name}」已儲存到雲端！")
                     st.session_state.current_menu_editor = create_empty_menu_df()
-                    st.rerun()
+                    profiler.rerun()
                 else:
                     st.warning("⚠️ 店家已新增到本地，但雲端儲存時發生問題")
 
     st.markdown("---")
-    st.subheader("📋 已儲存的店家")
-    vendor_query = st.text_input(
-        "搜尋店家",
-        placeholder="可搜尋店名、分類、備註或菜單品項",
-        key="vendor_search_query",
-    )
+    vendor_refresh = auto_refresh_control("vendor_list")
+    run_fragment(render_vendor_list, vendor_refresh)
 
-    if not st.session_state.vendors:
-        st.info("尚無店家資料，請先在上方新增店家。")
-    else:
-        filtered_vendors = [
-            (i, vendor) for i, vendor in enumerate(st.session_state.vendors)
-            if vendor_matches_query(vendor, vendor_query)
-        ]
-        st.caption(f"符合搜尋結果：{len(filtered_vendors)} / {len(st.session_state.vendors)} 間")
+    st.markdown("---")
+    st.subheader("🔁 定期開團")
+    st.caption("設定每週固定開團的店家，可一次建立接下來幾次的團購，直接沿用店家的菜單與圖片。")
 
-        if not filtered_vendors:
-            st.warning("找不到符合條件的店家，請換個關鍵字試試看。")
+    if 'templates' not in st.session_state:
+        st.session_state.templates = db_load_templates()
+    vendors_by_id = {vendor['id']: vendor for vendor in st.session_state.vendors}
 
-        for i, vendor in filtered_vendors:
-            with st.expander(f"🏪 {vendor['vendor_name']}  ·  {vendor['category']}", expanded=False):
-                st.caption(f"說明：{vendor['description'] or '（無）'}")
-                st.dataframe(vendor['menu'], use_container_width=True)
-                if vendor.get('menu_image_bytes'):
-                    st.image(io.BytesIO(vendor['menu_image_bytes']), caption="菜單圖片", use_container_width=True)
-                btn_c1, btn_c2 = st.columns(2)
-                with btn_c1:
-                    if st.button(f"🚀 直接開團", key=f"quick_group_{vendor['id']}"):
-                        load_vendor_into_group_form(vendor)
-                        st.session_state['_goto_page'] = "我要開團 (團主)"
-                        st.rerun()
-                with btn_c2:
-                    if st.button(f"🗑️ 刪除", key=f"del_vendor_{vendor['id']}"):
-                        st.session_state.vendors.pop(i)
-                        db_delete_vendor(vendor['id'])
-                        st.rerun()
+    with st.expander("➕ 新增定期開團", expanded=False):
+        if not vendors_by_id:
+            st.info("請先在上方新增店家。")
+        else:
+            with st.form("new_template_form"):
+                tpl_vendor_id = st.selectbox(
+                    "店家", list(vendors_by_id), format_func=lambda vid: vendors_by_id[vid]['vendor_name']
+                )
+                tc1, tc2 = st.columns(2)
+                with tc1:
+                    tpl_weekday = st.selectbox("每週", list(range(7)), format_func=lambda day: WEEKDAY_LABELS[day])
+                with tc2:
+                    tpl_time_str = st.text_input("收單時間 (HH:MM)", value="11:00")
+                tpl_description = st.text_input("說明備註（留空則沿用店家備註）")
+                tpl_submitted = st.form_submit_button("💾 儲存定期開團")
+
+            if tpl_submitted:
+                if not re.match(TIME_PATTERN, tpl_time_str):
+                    st.error("❌ 請輸入正確的時間格式 (HH:MM)")
+                else:
+                    new_template = {
+                        "id": str(uuid.uuid4()),
+                        "vendor_id": tpl_vendor_id,
+                        "weekday": tpl_weekday,
+                        "deadline_time": datetime.strptime(tpl_time_str, "%H:%M").time(),
+                        "description": normalize_text(tpl_description),
+                    }
+                    if db_save_template(new_template):
+                        st.session_state.templates.append(new_template)
+                        profiler.rerun()
+
+    if not st.session_state.templates:
+        st.info("尚無定期開團設定。")
+    else:
+        for tpl in list(st.session_state.templates):
+            vendor = vendors_by_id.get(tpl['vendor_id'])
+            tpl_label = (
+                f"{WEEKDAY_LABELS[tpl['weekday']]} {tpl['deadline_time'].strftime('%H:%M')} 收單"
+                f" · {vendor['vendor_name'] if vendor else '（店家已刪除）'}"
+            )
+            tl1, tl2 = st.columns([4, 1])
+            with tl1:
+                st.markdown(f"**{tpl_label}**" + (f"　{tpl['description']}" if tpl['description'] else ""))
+            with tl2:
+                if st.button("🗑️ 刪除", key=f"del_template_{tpl['id']}"):
+                    if db_delete_template(tpl['id']):
+                        st.session_state.templates.remove(tpl)
+                        profiler.rerun()
+
+        oc1, oc2 = st.columns([1, 2])
+        with oc1:
+            occurrences = st.number_input("每個範本建立接下來幾次", min_value=1, max_value=8, value=2)
+        with oc2:
+            st.write("")
+            if st.button("🗓️ 建立定期團購", type="primary"):
+                created = db_create_groups_from_templates(int(occurrences))
+                if created is None:
+                    st.error("❌ 建立失敗，請確認雲端資料庫連線後再試一次。")
+                else:
+                    load_data()
+                    st.success(f"✅ 已建立 {created} 個團購（已建立過的場次會自動略過）")
 
 # ================= 頁面 1: 團主開團 =================
 elif page == "我要開團 (團主)":
@@ -360,7 +764,7 @@ elif page == "我要開團 (團主)":
         with cy:
             if st.button("✅ 是，儲存店家", key="confirm_save_vendor"):
                 st.session_state.pop('_ask_save_vendor')
-                if find_vendor_by_name(ask['name']):
+                if find_vendor_by_name(st.session_state.vendors, ask['name']):
                     st.info("ℹ️ 店家清單中已存在同名店家，已略過儲存。")
                 else:
                     new_v = {
@@ -369,16 +773,17 @@ elif page == "我要開團 (團主)":
                         "category": ask['category'],
                         "description": normalize_text(ask['description']),
                         "menu": sanitize_menu_dataframe(ask['menu']),
+                        "option_sets": ask.get('option_sets', []),
                         "menu_image_bytes": ask['image_bytes'],
                     }
                     st.session_state.vendors.append(new_v)
                     save_vendor_to_cloud(new_v)
                     st.success("✅ 店家已儲存到雲端！")
-                st.rerun()
+                profiler.rerun()
         with cn:
             if st.button("❌ 不用，謝謝", key="skip_save_vendor"):
                 st.session_state.pop('_ask_save_vendor')
-                st.rerun()
+                profiler.rerun()
         st.stop()
 
     elif st.session_state.get('_ask_update_vendor'):
@@ -408,16 +813,17 @@ elif page == "我要開團 (團主)":
                             v['category'] = ask['category']
                             v['description'] = normalize_text(ask['description'])
                             v['menu'] = sanitize_menu_dataframe(ask['menu'])
+                            v['option_sets'] = ask.get('option_sets', [])
                             v['menu_image_bytes'] = ask['image_bytes']
                             save_vendor_to_cloud(v)
                             break
                     st.session_state.pop('_ask_update_vendor')
                     st.success("✅ 店家資料已更新！")
-                    st.rerun()
+                    profiler.rerun()
         with cn:
             if st.button("❌ 不用，謝謝", key="skip_update_vendor"):
                 st.session_state.pop('_ask_update_vendor')
-                st.rerun()
+                profiler.rerun()
         st.stop()
 
 
@@ -441,6 +847,12 @@ elif page == "我要開團 (團主)":
             value=st.session_state.get('_grp_description', ''),
             placeholder="例如:這家很快,要在11點前送單,請大家配合。"
         )
+        option_sets_text = st.text_area(
+            "客製化選項 (選填)",
+            value=st.session_state.get('_grp_option_sets', ''),
+            placeholder=OPTION_SETS_PLACEHOLDER,
+            help="點餐時以下拉選單選擇；「甜度」「冰塊」為必選。飲料類未填寫時使用預設的甜度與冰塊選項。",
+        )
         uploaded_image = st.file_uploader("上傳原始菜單圖片 (供點餐者參考)", type=["png", "jpg", "jpeg"], key="menu_image_uploader")
         existing_group_image = st.session_state.get('_grp_menu_image_bytes')
         if existing_group_image and uploaded_image is None:
@@ -455,7 +867,7 @@ elif page == "我要開團 (團主)":
         now = now_tw()
         default_time = (now.replace(second=0, microsecond=0) + pd.Timedelta(hours=1)).strftime('%H:%M')
         t_str = st.text_input("收單時間 (HH:MM)", value=default_time, help="請輸入24小時制時間，例如 14:30")
-        time_valid = re.match(r"^(?:[01]?\d|2[0-3]):[0-5]\d$", t_str)
+        time_valid = re.match(TIME_PATTERN, t_str)
         if not time_valid:
             st.warning("請輸入正確的時間格式 (HH:MM)")
         else:
@@ -480,7 +892,7 @@ elif page == "我要開團 (團主)":
             try:
                 df_import = pd.read_excel(uploaded_file)
                 if "品名" in df_import.columns and "價格" in df_import.columns:
-                    st.session_state.current_menu_editor = df_import[["品名", "價格"]].copy()
+                    st.session_state.current_menu_editor = df_import[[c for c in [*MENU_COLUMNS, MENU_SECTION_COLUMN] if c in df_import.columns]].copy()
                     st.success(f"讀取成功!共 {len(st.session_state.current_menu_editor)} 筆商品,已載入到下方表格。")
                 else:
                     st.error("Excel 格式錯誤!找不到「品名」或「價格」欄位。")
@@ -499,8 +911,15 @@ elif page == "我要開團 (團主)":
     if st.button("🚀 確認發起團購", type="primary"):
         normalized_vendor_name = normalize_text(vendor_name)
         final_menu_df = sanitize_menu_dataframe(st.session_state.current_menu_editor)
+        try:
+            group_option_sets = parse_option_sets(option_sets_text)
+            option_sets_error = None
+        except ValueError as e:
+            option_sets_error = str(e)
         if not normalized_vendor_name:
             st.error("❌ 請輸入店家名稱!")
+        elif option_sets_error:
+            st.error(f"❌ 客製化選項{option_sets_error}")
         elif final_menu_df.empty:
             st.error("❌ 菜單為空!請輸入至少一個品項。")
         elif not time_valid:
@@ -513,7 +932,8 @@ elif page == "我要開團 (團主)":
                 "id": str(uuid.uuid4()), "vendor_name": normalized_vendor_name,
                 "category": category, "description": normalize_text(description),
                 "deadline": deadline_dt, "menu": final_menu_df,
-                "orders": [], "created_at": now_tw(),
+                "option_sets": group_option_sets,
+                "created_at": now_tw(),
                 "menu_image_bytes": image_bytes,
             }
             st.session_state.groups.append(new_group)
@@ -523,13 +943,15 @@ elif page == "我要開團 (團主)":
             deadline_str = deadline_dt.strftime('%Y-%m-%d %H:%M')
 
             # 清除預填 session_state
-            for k in ['_grp_vendor_name', '_grp_category', '_grp_description', '_grp_loaded_vendor_id', '_grp_menu_image_bytes']:
+            for k in ['_grp_vendor_name', '_grp_category', '_grp_description', '_grp_option_sets',
+                      '_grp_loaded_vendor_id', '_grp_menu_image_bytes']:
                 st.session_state.pop(k, None)
             st.session_state.current_menu_editor = create_empty_menu_df()
 
             ask_payload = {
                 'name': normalized_vendor_name, 'category': category,
                 'description': normalize_text(description), 'menu': final_menu_df,
+                'option_sets': group_option_sets,
                 'image_bytes': image_bytes, 'deadline_str': deadline_str,
             }
 
@@ -543,12 +965,13 @@ elif page == "我要開團 (團主)":
                         normalized_vendor_name != src['vendor_name']
                         or category != src['category']
                         or normalize_text(description) != src['description']
+                        or group_option_sets != src['option_sets']
                     )
                     image_changed = image_bytes != src.get('menu_image_bytes')
                     if menu_changed or info_changed or image_changed:
                         ask_payload['vendor_id'] = loaded_vid
                         st.session_state['_ask_update_vendor'] = ask_payload
-                        st.rerun()
+                        profiler.rerun()
                     else:
                         st.balloons()
                         st.success(f"✅ 成功開團！店家：{normalized_vendor_name}，收單時間：{deadline_str}")
@@ -556,10 +979,10 @@ elif page == "我要開團 (團主)":
                 else:
                     st.balloons()
                     st.success(f"✅ 成功開團！店家：{normalized_vendor_name}，收單時間：{deadline_str}")
-            elif not find_vendor_by_name(normalized_vendor_name):
+            elif not find_vendor_by_name(st.session_state.vendors, normalized_vendor_name):
                 # 新店家（手動輸入） → 詢問是否儲存
                 st.session_state['_ask_save_vendor'] = ask_payload
-                st.rerun()
+                profiler.rerun()
             else:
                 st.balloons()
                 st.success(f"✅ 成功開團！店家：{normalized_vendor_name}，收單時間：{deadline_str}")
@@ -569,7 +992,7 @@ elif page == "我要開團 (團主)":
 elif page == "我要點餐 (團員)":
     st.title("👋 我要點餐")
 
-    group_options = get_group_options()
+    group_options = get_group_options(st.session_state.groups)
 
     if not group_options:
         st.warning("目前沒有任何團購活動。")
@@ -589,95 +1012,21 @@ elif page == "我要點餐 (團員)":
                     image_buffer = io.BytesIO(group['menu_image_bytes'])
                     st.image(image_buffer, caption=f"{group['vendor_name']} 原始菜單", use_container_width=True)
 
-            time_left = group['deadline'] - now_tw()
-            if time_left.total_seconds() <= 0:
-                st.error("⛔ 這團已經截止收單囉！")
-            else:
-                time_str = str(time_left).split('.')[0]
-                st.success(f"🟢 開放點餐中 (剩餘 {time_str})")
-
-                with st.form(key=f"form_{group['id']}"):
-                    user_name = st.text_input("您的姓名 (必填)")
-
-                    menu_records = group['menu'].to_dict('records')
-                    selected_item_index = st.selectbox(
-                        "選擇餐點 (可輸入關鍵字搜尋)",
-                        options=[-1] + list(range(len(menu_records))),
-                        format_func=lambda idx: (
-                            "(請選擇)"
-                            if idx == -1
-                            else f"{menu_records[idx]['品名']} (${format_price(menu_records[idx]['價格'])})"
-                        ),
-                        key=f"menu_select_{group['id']}"
-                    )
-
-                    sugar_choice = "(請選擇)"
-                    ice_choice = "(請選擇)"
-
-                    if group['category'] == "飲料":
-                        st.markdown("**🍹 飲料客製化選項 (必填)**")
-                        c_bev1, c_bev2 = st.columns(2)
-                        with c_bev1:
-                            sugar_opts = ["(請選擇)", "正常糖", "少糖 (7分)", "半糖 (5分)", "微糖 (3分)", "一分糖", "無糖"]
-                            sugar_choice = st.selectbox("甜度", sugar_opts, key=f"sugar_{group['id']}")
-                        with c_bev2:
-                            ice_opts = ["(請選擇)", "正常冰", "少冰", "微冰", "去冰", "完全去冰", "溫", "熱"]
-                            ice_choice = st.selectbox("冰塊", ice_opts, key=f"ice_{group['id']}")
-
-                    col_q1, col_q2 = st.columns(2)
-                    with col_q1:
-                        quantity = st.number_input("數量", min_value=1, value=1, key=f"qty_{group['id']}")
-                    with col_q2:
-                        note = st.text_input("其他備註 (例如：加珍珠)", key=f"note_{group['id']}")
-
-                    submit = st.form_submit_button("送出訂單")
-
-                    if submit:
-                        if not normalize_text(user_name):
-                            st.error("❌ 請輸入姓名！")
-                        elif selected_item_index == -1:
-                            st.error("❌ 請選擇一項餐點！")
-                        elif group['category'] == "飲料" and (sugar_choice == "(請選擇)" or ice_choice == "(請選擇)"):
-                            st.error("❌ 飲料類別請務必選擇「甜度」與「冰塊」！")
-                        else:
-                            try:
-                                selected_item = menu_records[selected_item_index]
-                                item_name = selected_item["品名"]
-                                item_price = float(selected_item["價格"])
-                                item_price = int(item_price) if item_price.is_integer() else item_price
-                                quantity_value = int(quantity)
-
-                                final_note = note
-                                if group['category'] == "飲料":
-                                    bev_note = f"{sugar_choice}/{ice_choice}"
-                                    final_note = f"{bev_note}, {note}" if note else bev_note
-
-                                order_entry = {
-                                    "姓名": normalize_text(user_name),
-                                    "品項": item_name,
-                                    "單價": item_price,
-                                    "數量": quantity_value,
-                                    "總價": item_price * quantity_value,
-                                    "備註": normalize_text(final_note),
-                                    "下單時間": now_tw().strftime("%Y-%m-%d %H:%M:%S")
-                                }
-
-                                group['orders'].append(order_entry)
-
-                                if save_order_to_cloud(group['id'], order_entry):
-                                    st.success(f"✅ {user_name}，您的「{item_name}」已訂購成功！")
-                                    st.info("💾 訂單已儲存到雲端資料庫")
-                                else:
-                                    st.warning("⚠️ 訂單已加入本地，但雲端儲存時發生問題")
-                            except Exception as e:
-                                st.error(f"系統錯誤：{e}")
+            order_refresh = auto_refresh_control("order_form")
+            run_fragment(render_order_form, order_refresh, group['id'])
 
 # ================= 頁面 3: 訂單管理 =================
 elif page == "訂單管理 (統計/結算)":
     st.title("📊 訂單管理與統計")
 
-    group_options = get_group_options()
-    if not group_options:
+    view_archive = st.toggle(
+        "📦 檢視已封存的團購", key="admin_view_archive",
+        help=f"收單超過 {ARCHIVE_AFTER_DAYS} 天的團購會連同訂單自動封存，不再出現在一般列表中" if ARCHIVE_AFTER_DAYS > 0 else None,
+    )
+    group_options = get_group_options(st.session_state.groups)
+    if view_archive:
+        render_archived_groups()
+    elif not group_options:
         st.info("目前沒有資料。")
     else:
         st.markdown("### 選擇要檢視的團購")
@@ -689,37 +1038,52 @@ elif page == "訂單管理 (統計/結算)":
             st.divider()
             st.subheader(f"店家：{group['vendor_name']}")
 
-            if not group['orders']:
-                st.warning("尚無訂單。")
-            else:
-                df_orders = pd.DataFrame(group['orders'])
-
-                with st.expander("展開詳細訂單列表", expanded=True):
-                    st.dataframe(df_orders, use_container_width=True)
-
-                total_money = df_orders["總價"].sum()
-                total_qty = df_orders["數量"].sum()
-                st.metric("本團總金額", f"${total_money}", delta=f"共 {total_qty} 份餐點")
-
-                st.subheader("📝 廠商叫貨單 (合併相同品項與需求)")
-                summary = df_orders.groupby(["品項", "備註"])["數量"].sum().reset_index()
-                st.dataframe(summary, use_container_width=True)
-
-                csv = df_orders.to_csv(index=False).encode('utf-8-sig')
-                st.download_button(
-                    label=f"📥 下載 [{group['vendor_name']}] 訂單 CSV",
-                    data=csv,
-                    file_name=f"orders_{group['vendor_name']}.csv",
-                    mime='text/csv',
-                )
+            stats_refresh = auto_refresh_control("order_stats")
+            run_fragment(render_order_stats, stats_refresh, group['id'])
 
 # --- 側邊欄：系統資訊 ---
 with st.sidebar.expander("🔧 系統資訊", expanded=False):
     st.caption("☁️ 資料儲存方式：Supabase 雲端 PostgreSQL")
+    status = db_status()
+    breaker_labels = {"closed": "🟢 正常", "open": "🔴 離線（暫停連線）", "half_open": "🟡 嘗試恢復中"}
+    st.caption(f"🔌 資料庫連線：{breaker_labels[status['breaker']]}")
+    if status['pending_writes']:
+        st.caption(f"📤 待同步的暫存資料：{status['pending_writes']} 筆")
+    cache_breaker = "" if status['cache']['breaker'] == "closed" else f"（{breaker_labels[status['cache']['breaker']]}）"
+    st.caption(f"🗄️ 共用快取：{status['cache']['backend']}{cache_breaker}")
+    if status['cache']['last_error']:
+        st.caption(f"⚠️ 共用快取錯誤：{status['cache']['last_error']}")
+    if status['archive_last_error']:
+        st.caption(f"⚠️ 自動封存失敗：{status['archive_last_error']}")
+    if status['snapshot_saved_at']:
+        st.caption(f"💾 本機快照時間：{status['snapshot_saved_at'].strftime('%Y-%m-%d %H:%M:%S')}")
+    writer_stats = db_order_writer_stats()
+    if writer_stats and writer_stats['total_batches']:
+        st.caption(
+            f"📨 訂單批次寫入：{writer_stats['total_orders']} 筆 / {writer_stats['total_batches']} 批"
+            f"（平均 {writer_stats['avg_batch_size']:.1f} 筆、最多 {writer_stats['max_batch_size']} 筆），"
+            f"排隊 p50 {writer_stats['wait_p50_ms']:.0f} ms / p95 {writer_stats['wait_p95_ms']:.0f} ms"
+        )
     st.caption(f"🏪 店家數量：{len(st.session_state.vendors)} 間")
     st.caption(f"📦 團購數量：{len(st.session_state.groups)} 個")
-    total_orders = sum(len(g.get('orders', [])) for g in st.session_state.groups)
-    st.caption(f"📝 總訂單數：{total_orders} 筆")
     if st.button("🔄 重新載入雲端資料", key="reload_cloud"):
+        # 略過共用快取中可能過時的資料（例如排程或 SQL 直接修改），其他 session 也會跟著重新載入
+        db_invalidate_catalog()
         load_data()
-        st.rerun()
+        profiler.rerun()
+    if ARCHIVE_AFTER_DAYS > 0 and st.button(f"📦 立即封存收單超過 {ARCHIVE_AFTER_DAYS} 天的團購", key="archive_now"):
+        archived = db_archive_old_groups()
+        if archived is not None:
+            st.toast(f"📦 已封存 {archived} 個團購")
+            load_data()
+            profiler.rerun()
+    st.divider()
+    profiler.render_controls()
+
+# --- 先以快照完成首次畫面，畫面送出後再同步雲端資料；離線時在斷路器允許時自動重試 ---
+_refresh_pending = st.session_state.pop('_refresh_after_render', False)
+if _refresh_pending or (st.session_state.data_source != "cloud" and db_status()["breaker"] != "open"):
+    if load_data() or _refresh_pending:
+        profiler.rerun()
+
+profiler.end_rerun()
@@ -0,0 +1,293 @@
+"""
+菜單、店家與訂單的純資料處理函式
+不依賴 Streamlit 的頁面狀態，menu.py 與效能基準測試（benchmarks/）共用。
+"""
+import re
+from datetime import datetime
+
+import pandas as pd
+
+from db import TAIWAN_TZ
+
+MENU_COLUMNS = ["品名", "價格"]
+MENU_SECTION_COLUMN = "分區"  # 選填：菜單分區（例如「茶類」「奶茶」），點餐時可依分區篩選
+CATEGORY_OPTIONS = ["餐點", "飲料", "其他"]
+
+# 客製化選項：甜度、冰塊存到訂單的獨立欄位且必選，其他選項（例如加料、尺寸）選填
+SUGAR_OPTION_NAME = "甜度"
+ICE_OPTION_NAME = "冰塊"
+ORDER_OPTION_COLUMNS = [SUGAR_OPTION_NAME, ICE_OPTION_NAME, "選項"]
+# 飲料類店家未自訂選項時使用
+DEFAULT_DRINK_OPTION_SETS = [
+    {"name": SUGAR_OPTION_NAME, "choices": ["正常糖", "少糖 (7分)", "半糖 (5分)", "微糖 (3分)", "一分糖", "無糖"]},
+    {"name": ICE_OPTION_NAME, "choices": ["正常冰", "少冰", "微冰", "去冰", "完全去冰", "溫", "熱"]},
+]
+
+
+def now_tw() -> datetime:
+    """取得台灣本地時間（無時區標記的 naive datetime）"""
+    return datetime.now(TAIWAN_TZ).replace(tzinfo=None)
+
+
+def create_empty_menu_df():
+    return pd.DataFrame(columns=MENU_COLUMNS)
+
+
+def is_group_active(group):
+    return group['deadline'] > now_tw()
+
+
+def normalize_text(value):
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def normalize_vendor_name(name):
+    return normalize_text(name).casefold()
+
+
+def format_price(value):
+    price = float(value)
+    return str(int(price)) if price.is_integer() else f"{price:g}"
+
+
+def sanitize_menu_dataframe(menu_data):
+    df = pd.DataFrame(menu_data).copy()
+
+    for column in MENU_COLUMNS:
+        if column not in df.columns:
+            df[column] = pd.NA
+
+    has_sections = MENU_SECTION_COLUMN in df.columns
+    df = df[MENU_COLUMNS + ([MENU_SECTION_COLUMN] if has_sections else [])]
+    df["品名"] = df["品名"].astype("string").fillna("").str.strip()
+    df["價格"] = pd.to_numeric(df["價格"], errors="coerce")
+    df = df[(df["品名"] != "") & df["價格"].notna()].copy()
+
+    if df.empty:
+        return create_empty_menu_df()
+
+    df["價格"] = df["價格"].apply(lambda price: int(price) if float(price).is_integer() else float(price))
+    if has_sections:
+        df[MENU_SECTION_COLUMN] = df[MENU_SECTION_COLUMN].astype("string").fillna("").str.strip()
+        # 全部未填分區時不保留此欄，與沒有分區的菜單視為相同
+        if (df[MENU_SECTION_COLUMN] == "").all():
+            df = df.drop(columns=[MENU_SECTION_COLUMN])
+    return df.reset_index(drop=True)
+
+
+def vendor_matches_query(vendor, query):
+    keywords = [part.casefold() for part in normalize_text(query).split() if part.strip()]
+    if not keywords:
+        return True
+
+    menu_items = []
+    if "品名" in vendor["menu"].columns:
+        menu_items = vendor["menu"]["品名"].astype(str).tolist()
+
+    haystack_parts = [
+        vendor.get("vendor_name", ""),
+        vendor.get("category", ""),
+        vendor.get("description", ""),
+        *menu_items,
+    ]
+    haystack = " ".join(normalize_text(part) for part in haystack_parts).casefold()
+    return all(keyword in haystack for keyword in keywords)
+
+
+# --- 點餐菜單索引 ---
+def index_menu(menu_df):
+    """建立點餐用的菜單索引：顯示文字、搜尋用的正規化品名與分區（menu.py 依菜單內容快取）"""
+    names = menu_df["品名"].astype(str).tolist()
+    prices = menu_df["價格"].tolist()
+    section_values = (
+        menu_df[MENU_SECTION_COLUMN].astype(str).tolist()
+        if MENU_SECTION_COLUMN in menu_df.columns else [""] * len(names)
+    )
+
+    sections = {}
+    for idx, section in enumerate(section_values):
+        sections.setdefault(section or "其他", []).append(idx)
+    if list(sections) == ["其他"]:
+        sections = {}
+
+    labels = []
+    for name, price, section in zip(names, prices, section_values):
+        label = f"{name} (${format_price(price)})"
+        labels.append(f"[{section}] {label}" if sections and section else label)
+
+    # 有分區時依分區排列，同一分區的品項排在一起
+    order = [idx for section_indices in sections.values() for idx in section_indices] or list(range(len(names)))
+    return {
+        "names": names,
+        "prices": prices,
+        "labels": labels,
+        "keys": [name.casefold() for name in names],
+        "sections": sections,
+        "order": order,
+    }
+
+
+def search_menu_index(menu_index, query, section=None):
+    """搜尋菜單索引，回傳符合的品項位置
+
+    前綴相符的排在最前面，其次是包含關鍵字，最後是字元依序出現的模糊比對（例如「珍奶」→「珍珠奶茶」）。
+    """
+    candidates = menu_index["sections"].get(section, []) if section else menu_index["order"]
+    keyword = normalize_text(query).casefold()
+    if not keyword:
+        return list(candidates)
+
+    prefix_hits, substring_hits, fuzzy_hits = [], [], []
+    for idx in candidates:
+        key = menu_index["keys"][idx]
+        if key.startswith(keyword):
+            prefix_hits.append(idx)
+        elif keyword in key:
+            substring_hits.append(idx)
+        else:
+            chars = iter(key)
+            if all(char in chars for char in keyword):
+                fuzzy_hits.append(idx)
+    return prefix_hits + substring_hits + fuzzy_hits
+
+
+# --- 客製化選項 ---
+def parse_option_sets(text):
+    """將每行一組的「名稱：選項1、選項2」解析為選項清單，格式錯誤時拋出 ValueError"""
+    option_sets = []
+    for line in normalize_text(text).splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = re.match(r"^([^:：]+)[:：](.*)$", line)
+        choices = [c.strip() for c in re.split(r"[、,，]", match.group(2))] if match else []
+        choices = [c for c in choices if c]
+        if not match or not choices:
+            raise ValueError(f"「{line}」格式錯誤，請使用「名稱：選項1、選項2」")
+        name = match.group(1).strip()
+        if any(option_set['name'] == name for option_set in option_sets):
+            raise ValueError(f"選項「{name}」重複")
+        option_sets.append({"name": name, "choices": list(dict.fromkeys(choices))})
+    return option_sets
+
+
+def format_option_sets(option_sets):
+    """選項清單轉回每行一組的文字（供表單編輯）"""
+    return "\n".join(f"{option_set['name']}：{'、'.join(option_set['choices'])}" for option_set in option_sets or [])
+
+
+def get_option_sets(entity):
+    """店家或團購的客製化選項；飲料類未自訂時使用預設的甜度與冰塊"""
+    if entity.get('option_sets'):
+        return entity['option_sets']
+    return DEFAULT_DRINK_OPTION_SETS if entity.get('category') == "飲料" else []
+
+
+def format_order_options(options):
+    """其他選項 {"加料": "珍珠"} 轉為顯示文字"""
+    if not isinstance(options, dict):
+        return normalize_text(options)
+    return "、".join(f"{name}:{choice}" for name, choice in options.items())
+
+
+def get_order_option(order, name):
+    """訂單中某個客製化選項的選擇（甜度、冰塊為獨立欄位，其他在「選項」中）"""
+    if name in (SUGAR_OPTION_NAME, ICE_OPTION_NAME):
+        return order.get(name, "")
+    return (order.get("選項") or {}).get(name, "")
+
+
+def missing_required_options(option_sets, selections):
+    """尚未選擇的必選選項（甜度、冰塊）"""
+    return [
+        option_set['name'] for option_set in option_sets
+        if option_set['name'] in (SUGAR_OPTION_NAME, ICE_OPTION_NAME) and not selections.get(option_set['name'])
+    ]
+
+
+def option_fields(selections):
+    """將選擇轉為訂單欄位：甜度、冰塊各自一欄，其他選項放進「選項」"""
+    return {
+        SUGAR_OPTION_NAME: selections.get(SUGAR_OPTION_NAME, ""),
+        ICE_OPTION_NAME: selections.get(ICE_OPTION_NAME, ""),
+        "選項": {
+            name: choice for name, choice in selections.items()
+            if name not in (SUGAR_OPTION_NAME, ICE_OPTION_NAME) and choice
+        },
+    }
+
+
+def tidy_option_columns(df):
+    """「選項」轉為文字，並省略整欄皆空的客製化選項欄位（例如餐點類團購）"""
+    if "選項" in df.columns:
+        df["選項"] = df["選項"].map(format_order_options)
+    empty_columns = [
+        column for column in ORDER_OPTION_COLUMNS
+        if column in df.columns and not df[column].fillna("").astype(str).str.strip().any()
+    ]
+    return df.drop(columns=empty_columns)
+
+
+def normalize_loaded_vendor(v):
+    v['vendor_name'] = normalize_text(v.get('vendor_name'))
+    v['category'] = normalize_text(v.get('category')) or CATEGORY_OPTIONS[0]
+    v['description'] = normalize_text(v.get('description'))
+    v['menu'] = sanitize_menu_dataframe(v.get('menu', []))
+    v['option_sets'] = v.get('option_sets') or []
+    return v
+
+
+def normalize_loaded_group(g):
+    g['vendor_name'] = normalize_text(g.get('vendor_name'))
+    g['category'] = normalize_text(g.get('category')) or CATEGORY_OPTIONS[0]
+    g['description'] = normalize_text(g.get('description'))
+    g['menu'] = sanitize_menu_dataframe(g.get('menu', []))
+    g['option_sets'] = g.get('option_sets') or []
+    return g
+
+
+def get_group_options(groups):
+    """團購下拉選單的選項 {標籤: 團購 id}：進行中的在前，依收單時間排序"""
+    options = {}
+    sorted_groups = sorted(
+        groups,
+        key=lambda group: (not is_group_active(group), group['deadline'])
+    )
+
+    for group in sorted_groups:
+        status = "🟢進行中" if is_group_active(group) else "🔴已截止"
+        add_group_option(options, status, group, group['id'])
+    return options
+
+
+def add_group_option(options, status, group, value):
+    """加入一個團購選項；店家與收單時間相同時在標籤後加上編號避免重複"""
+    deadline_label = group['deadline'].strftime('%Y-%m-%d %H:%M')
+    base_label = f"{status} | {group['vendor_name']} ({group['category']}) | 收單 {deadline_label}"
+    label = base_label
+    duplicate_index = 2
+    while label in options:
+        label = f"{base_label} #{duplicate_index}"
+        duplicate_index += 1
+    options[label] = value
+
+
+def find_vendor_by_name(vendors, name):
+    target = normalize_vendor_name(name)
+    for v in vendors:
+        if normalize_vendor_name(v['vendor_name']) == target:
+            return v
+    return None
+
+
+def orders_to_dataframe(orders):
+    """訂單列表轉為顯示／匯出用的 DataFrame（不含內部 id 欄位）"""
+    return tidy_option_columns(pd.DataFrame(orders).drop(columns=["id"], errors="ignore"))
+
+
+def summarize_orders(df_orders):
+    """廠商叫貨單：依品項、客製化選項與備註合併數量與金額（資料庫端彙總無法使用時的備援）"""
+    group_columns = [c for c in ["品項", *ORDER_OPTION_COLUMNS, "備註"] if c in df_orders.columns]
+    return df_orders.fillna({"備註": ""}).groupby(group_columns)[["數量", "總價"]].sum().reset_index()
@@ -0,0 +1,104 @@
+"""
+訂單批次寫入器
+收單前常有大量團員在幾秒內同時送出訂單，逐筆寫入會讓每筆訂單各自等一次資料庫來回。
+這裡把短時間（預設數十毫秒）內送出的訂單合併成一次批次 insert，每位送出者仍各自拿到成功或失敗的結果。
+"""
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+
+class OrderBatchWriter:
+    """在背景執行緒中收集訂單，每 window_ms 或滿 max_batch_size 筆就批次寫入一次
+
+    insert_rows(rows) 負責實際寫入一批資料列，失敗時拋出例外。
+    is_connection_error(e) 判斷是否為連線層級的錯誤：連線錯誤時整批一起失敗；
+    其他錯誤（例如其中一筆的團購已被刪除）則將批次對半拆開重送，讓有問題的那筆單獨失敗。
+    """
+
+    def __init__(self, insert_rows, window_ms: float = 30, max_batch_size: int = 100,
+                 is_connection_error=lambda e: False, metrics_window: int = 1000):
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._insert_rows = insert_rows
+        self._is_connection_error = is_connection_error
+        self._queue = queue.Queue()
+
+        self._metrics_lock = threading.Lock()
+        self._batch_sizes = deque(maxlen=metrics_window)
+        self._queue_waits = deque(maxlen=metrics_window)
+        self._total_batches = 0
+        self._total_orders = 0
+
+        self._thread = threading.Thread(target=self._run, name="order-batch-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row: dict) -> Future:
+        """送出一筆訂單資料列，回傳的 Future 在寫入成功時得到 True，失敗時帶有例外"""
+        future = Future()
+        self._queue.put((row, future, time.monotonic()))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # 第一筆到達後再等 window 秒，期間送出的訂單併入同一批
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _insert_batch(self, batch: list) -> None:
+        try:
+            self._insert_rows([row for row, _, _ in batch])
+        except Exception as e:
+            if len(batch) == 1 or self._is_connection_error(e):
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                middle = len(batch) // 2
+                self._insert_batch(batch[:middle])
+                self._insert_batch(batch[middle:])
+        else:
+            for _, future, _ in batch:
+                future.set_result(True)
+
+    def _flush(self, batch: list) -> None:
+        started = time.monotonic()
+        self._insert_batch(batch)
+
+        with self._metrics_lock:
+            self._total_batches += 1
+            self._total_orders += len(batch)
+            self._batch_sizes.append(len(batch))
+            self._queue_waits.extend(started - enqueued_at for _, _, enqueued_at in batch)
+
+    def stats(self) -> dict:
+        """批次大小與排隊等待時間的統計（最近 metrics_window 批 / 筆）"""
+        with self._metrics_lock:
+            sizes = list(self._batch_sizes)
+            waits = sorted(self._queue_waits)
+            total_batches, total_orders = self._total_batches, self._total_orders
+
+        def percentile_ms(p):
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(len(waits) * p))] * 1000
+
+        return {
+            "total_batches": total_batches,
+            "total_orders": total_orders,
+            "queued": self._queue.qsize(),
+            "avg_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+            "max_batch_size": max(sizes, default=0),
+            "wait_p50_ms": percentile_ms(0.5),
+            "wait_p95_ms": percentile_ms(0.95),
+        }
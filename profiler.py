@@ -0,0 +1,229 @@
+"""
+整頁重跑（rerun）效能分析
+在 menu.py 開頭呼叫 begin_rerun()、結尾呼叫 end_rerun()（需要 st.rerun() 時改用 rerun()），以 cProfile 記錄整次重跑，
+保留最近幾次的報告（最耗時函式、呼叫樹），可在「🔧 系統資訊」中檢視與下載。
+只有輸入管理員密碼（secrets 或環境變數 MENU_ADMIN_PASSWORD）的 session 可以開啟與檢視；
+未開啟時只做一次 session_state 查詢，不會掛上 profiler。
+"""
+import os
+import io
+import hmac
+import time
+import marshal
+import cProfile
+import pstats
+from collections import deque
+from datetime import datetime
+
+import streamlit as st
+
+# 設定環境變數 MENU_PROFILE=1 可讓所有 session 都開啟效能分析
+PROFILE_ENV_ENABLED = os.environ.get("MENU_PROFILE", "").lower() in ("1", "true", "yes")
+# 每個 session 保留的報告數量
+MAX_REPORTS = int(os.environ.get("MENU_PROFILE_KEEP", "10"))
+
+TOP_FUNCTION_COUNT = 25
+CALL_TREE_MAX_DEPTH = 8
+CALL_TREE_MIN_SHARE = 0.01  # 呼叫樹只展開佔整體時間 1% 以上的函式
+
+
+def _admin_password() -> str:
+    """管理員密碼（優先從 Streamlit secrets 讀取，其次從環境變數）；未設定時回傳空字串"""
+    try:
+        return str(st.secrets["MENU_ADMIN_PASSWORD"])
+    except Exception:
+        return os.environ.get("MENU_ADMIN_PASSWORD", "")
+
+
+def is_admin() -> bool:
+    return st.session_state.get("_profiler_admin", False)
+
+
+def is_enabled() -> bool:
+    return PROFILE_ENV_ENABLED or (is_admin() and st.session_state.get("_profiler_enabled", False))
+
+
+def begin_rerun() -> None:
+    """開始記錄本次重跑
+
+    上一次重跑若因 st.stop() 或直接呼叫 st.rerun() 提早結束，沒有執行到 end_rerun()，
+    它的量測會包含兩次重跑之間的閒置時間，直接捨棄。
+    """
+    unfinished = st.session_state.pop("_profiler_active", None)
+    if unfinished is not None:
+        unfinished["profiler"].disable()
+
+    if not is_enabled():
+        return
+
+    profiler = cProfile.Profile()
+    st.session_state["_profiler_active"] = {
+        "profiler": profiler,
+        "page": st.session_state.get("current_page", ""),
+        "started_at": datetime.now(),
+        "started": time.perf_counter(),
+    }
+    profiler.enable()
+
+
+def end_rerun() -> None:
+    """結束記錄並保存報告"""
+    active = st.session_state.pop("_profiler_active", None)
+    if active is not None:
+        _finish(active)
+
+
+def rerun(**kwargs) -> None:
+    """結束並保存本次記錄後呼叫 st.rerun(**kwargs)；直接呼叫 st.rerun() 會跳過 end_rerun()，這次重跑的記錄會被捨棄"""
+    end_rerun()
+    st.rerun(**kwargs)
+
+
+def get_reports() -> list:
+    """最近的報告（新的在前）"""
+    return list(reversed(st.session_state.get("_profiler_reports", [])))
+
+
+def _finish(active: dict) -> None:
+    profiler = active["profiler"]
+    profiler.disable()
+    wall_ms = (time.perf_counter() - active["started"]) * 1000
+    profiler.create_stats()
+    stats = pstats.Stats(profiler)
+
+    report = {
+        "started_at": active["started_at"],
+        "page": active["page"],
+        "wall_ms": wall_ms,
+        "total_calls": stats.total_calls,
+        "top_cumulative": _top_functions(stats, "cumulative"),
+        "top_tottime": _top_functions(stats, "tottime"),
+        "call_tree": _call_tree(stats, wall_ms / 1000),
+        # 與 pstats.dump_stats() 相同的格式，可用 pstats / snakeviz 開啟
+        "prof_bytes": marshal.dumps(stats.stats),
+    }
+    report["text"] = _report_text(stats, report)
+
+    reports = st.session_state.setdefault("_profiler_reports", deque(maxlen=MAX_REPORTS))
+    reports.append(report)
+
+
+def _func_label(func: tuple) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name  # 內建函式，例如 <built-in method time.sleep>
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def _top_functions(stats: pstats.Stats, sort_key: str) -> list:
+    index = {"cumulative": 3, "tottime": 2}[sort_key]
+    entries = sorted(stats.stats.items(), key=lambda item: item[1][index], reverse=True)
+    return [
+        {
+            "函式": _func_label(func),
+            "呼叫次數": nc,
+            "自身時間 (ms)": round(tt * 1000, 2),
+            "累計時間 (ms)": round(ct * 1000, 2),
+        }
+        for func, (cc, nc, tt, ct, callers) in entries[:TOP_FUNCTION_COUNT]
+    ]
+
+
+def _call_tree(stats: pstats.Stats, wall_seconds: float) -> str:
+    """由 pstats 的呼叫者資訊反推出呼叫樹
+
+    profiler 是在腳本執行途中才開啟的，腳本本身不會出現在統計裡；
+    沒有呼叫者的函式就是腳本直接呼叫的，把它們掛在「整次重跑」底下。
+    """
+    children = {}
+    top_level = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if not callers:
+            top_level.append((func, ct))
+        for caller, caller_stats in callers.items():
+            children.setdefault(caller, []).append((func, caller_stats[3]))
+
+    total = wall_seconds or 1e-9
+    lines = [f"{1:6.1%}  {total * 1000:9.2f} ms  （整次重跑）"]
+
+    def walk(func, cumulative, depth, path):
+        lines.append(f"{'  ' * depth}{cumulative / total:6.1%}  {cumulative * 1000:9.2f} ms  {_func_label(func)}")
+        if depth >= CALL_TREE_MAX_DEPTH:
+            return
+        for child, child_cumulative in sorted(children.get(func, []), key=lambda item: item[1], reverse=True):
+            if child in path or child_cumulative / total < CALL_TREE_MIN_SHARE:
+                continue
+            walk(child, child_cumulative, depth + 1, path | {child})
+
+    for func, cumulative in sorted(top_level, key=lambda item: item[1], reverse=True):
+        if cumulative / total >= CALL_TREE_MIN_SHARE:
+            walk(func, cumulative, 1, {func})
+    return "\n".join(lines)
+
+
+def _report_text(stats: pstats.Stats, report: dict) -> str:
+    output = io.StringIO()
+    output.write(f"開始時間：{report['started_at']:%Y-%m-%d %H:%M:%S}\n")
+    output.write(f"頁面：{report['page']}\n")
+    output.write(f"總耗時：{report['wall_ms']:.1f} ms（{report['total_calls']} 次函式呼叫）\n")
+    output.write("\n===== 呼叫樹 =====\n")
+    output.write(report["call_tree"] + "\n")
+    output.write("\n===== 最耗時函式（依累計時間） =====\n")
+    stats.stream = output
+    stats.sort_stats("cumulative").print_stats(TOP_FUNCTION_COUNT)
+    output.write("\n===== 最耗時函式（依自身時間） =====\n")
+    stats.sort_stats("tottime").print_stats(TOP_FUNCTION_COUNT)
+    return output.getvalue()
+
+
+def _render_admin_login() -> None:
+    password = _admin_password()
+    if not password:
+        st.caption("⏱️ 效能分析需要管理員權限（請設定 MENU_ADMIN_PASSWORD）")
+        return
+    entered = st.text_input("⏱️ 效能分析（管理員密碼）", type="password", key="_profiler_password")
+    if not entered:
+        return
+    if hmac.compare_digest(entered.encode("utf-8"), password.encode("utf-8")):
+        st.session_state["_profiler_admin"] = True
+        rerun()
+    st.error("密碼錯誤")
+
+
+def render_controls() -> None:
+    """在「🔧 系統資訊」中顯示開關與報告（僅限管理員）"""
+    if not is_admin():
+        _render_admin_login()
+        return
+
+    if PROFILE_ENV_ENABLED:
+        st.caption("⏱️ 效能分析已由環境變數 MENU_PROFILE 開啟")
+    else:
+        st.toggle("⏱️ 效能分析模式", key="_profiler_enabled", help="記錄每次整頁重跑的耗時分佈（會稍微拖慢速度）")
+
+    reports = get_reports()
+    if not reports:
+        if is_enabled():
+            st.caption("操作頁面後，這裡會出現最近幾次重跑的分析報告。")
+        return
+
+    labels = [
+        f"{r['started_at']:%H:%M:%S} · {r['page']} · {r['wall_ms']:.0f} ms"
+        for r in reports
+    ]
+    selected = st.selectbox("分析報告", range(len(reports)), format_func=labels.__getitem__, key="_profiler_report_select")
+    report = reports[selected]
+
+    st.caption(f"共 {report['total_calls']} 次函式呼叫")
+    st.markdown("**呼叫樹**")
+    st.code(report["call_tree"] or "（無資料）", language=None)
+    st.markdown("**最耗時函式（依累計時間）**")
+    st.dataframe(report["top_cumulative"], use_container_width=True, hide_index=True)
+    st.markdown("**最耗時函式（依自身時間）**")
+    st.dataframe(report["top_tottime"], use_container_width=True, hide_index=True)
+
+    stamp = report["started_at"].strftime("%Y%m%d_%H%M%S")
+    st.download_button("📥 下載文字報告", report["text"].encode("utf-8"), file_name=f"profile_{stamp}.txt",
+                       mime="text/plain", key="_profiler_download_text")
+    st.download_button("📥 下載 .prof（可用 snakeviz 開啟）", report["prof_bytes"], file_name=f"profile_{stamp}.prof",
+                       mime="application/octet-stream", key="_profiler_download_prof")
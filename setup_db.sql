@@ -42,15 +42,118 @@ CREATE TABLE IF NOT EXISTS orders (
     created_at  TIMESTAMPTZ DEFAULT now()
 );
 
+-- 4. 定期開團範本（每週固定店家、星期與收單時間）
+CREATE TABLE IF NOT EXISTS group_templates (
+    id            TEXT PRIMARY KEY,
+    vendor_id     TEXT NOT NULL REFERENCES vendors(id) ON DELETE CASCADE,
+    weekday       SMALLINT NOT NULL CHECK (weekday BETWEEN 0 AND 6),  -- 0 = 週一 … 6 = 週日
+    deadline_time TIME NOT NULL,
+    description   TEXT DEFAULT '',
+    active        BOOLEAN NOT NULL DEFAULT true,
+    created_at    TIMESTAMPTZ DEFAULT now()
+);
+
+-- 由範本建立的團購記錄來源範本；同一範本同一收單時間只會建立一次
+ALTER TABLE groups ADD COLUMN IF NOT EXISTS template_id TEXT REFERENCES group_templates(id) ON DELETE SET NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_groups_template_deadline ON groups(template_id, deadline);
+
+-- 客製化選項：店家與團購各自定義選項清單 [{"name": "甜度", "choices": [...]}, ...]（開團時由店家複製）；
+-- 訂單的甜度、冰塊存成獨立欄位，其他選項存成 {"選項名稱": "選擇"}，叫貨單可直接依欄位彙總
+ALTER TABLE vendors ADD COLUMN IF NOT EXISTS option_sets JSONB DEFAULT '[]'::jsonb;
+ALTER TABLE groups ADD COLUMN IF NOT EXISTS option_sets JSONB DEFAULT '[]'::jsonb;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS sugar TEXT NOT NULL DEFAULT '';
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS ice TEXT NOT NULL DEFAULT '';
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS options JSONB NOT NULL DEFAULT '{}'::jsonb;
+
+-- 5. 封存表：收單超過保留天數的團購與其訂單由 archive_closed_groups() 搬到這裡，
+--    讓 groups / orders 只保留近期資料；封存資料仍可供統計與匯出查詢
+CREATE TABLE IF NOT EXISTS groups_archive (
+    id          TEXT PRIMARY KEY,
+    vendor_name TEXT NOT NULL DEFAULT '',
+    category    TEXT NOT NULL DEFAULT '餐點',
+    description TEXT DEFAULT '',
+    deadline    TIMESTAMPTZ NOT NULL,
+    created_at  TIMESTAMPTZ,
+    menu        JSONB DEFAULT '[]'::jsonb,
+    menu_image_b64 TEXT,
+    updated_at  TIMESTAMPTZ,
+    template_id TEXT,  -- 範本可能已刪除，不設外鍵
+    archived_at TIMESTAMPTZ DEFAULT now()
+);
+ALTER TABLE groups_archive ADD COLUMN IF NOT EXISTS option_sets JSONB DEFAULT '[]'::jsonb;
+
+CREATE TABLE IF NOT EXISTS orders_archive (
+    id          TEXT PRIMARY KEY,
+    group_id    TEXT NOT NULL REFERENCES groups_archive(id) ON DELETE CASCADE,
+    user_name   TEXT NOT NULL DEFAULT '',
+    item_name   TEXT NOT NULL DEFAULT '',
+    unit_price  NUMERIC(10,2) NOT NULL DEFAULT 0,
+    quantity    INTEGER NOT NULL DEFAULT 1,
+    total_price NUMERIC(10,2) NOT NULL DEFAULT 0,
+    note        TEXT DEFAULT '',
+    ordered_at  TEXT DEFAULT '',
+    created_at  TIMESTAMPTZ
+);
+ALTER TABLE orders_archive ADD COLUMN IF NOT EXISTS sugar TEXT NOT NULL DEFAULT '';
+ALTER TABLE orders_archive ADD COLUMN IF NOT EXISTS ice TEXT NOT NULL DEFAULT '';
+ALTER TABLE orders_archive ADD COLUMN IF NOT EXISTS options JSONB NOT NULL DEFAULT '{}'::jsonb;
+
+-- 舊版把甜度與冰塊併在備註裡（「半糖 (5分)/少冰, 其他備註」），拆回獨立欄位（可重複執行）
+-- 只處理飲料團購、且備註開頭完全符合「甜度/冰塊」格式的訂單，避免誤拆「不要糖」之類的餐點備註
+UPDATE orders o SET
+    sugar = split_part(split_part(o.note, ', ', 1), '/', 1),
+    ice = split_part(split_part(o.note, ', ', 1), '/', 2),
+    note = CASE WHEN position(', ' IN o.note) > 0 THEN substr(o.note, position(', ' IN o.note) + 2) ELSE '' END
+FROM groups g
+WHERE g.id = o.group_id AND g.category = '飲料'
+  AND o.sugar = '' AND o.note ~ '^[^/,]*糖[^/,]*/[^/,]*(冰|溫|熱)[^,]*(, |$)';
+UPDATE orders_archive o SET
+    sugar = split_part(split_part(o.note, ', ', 1), '/', 1),
+    ice = split_part(split_part(o.note, ', ', 1), '/', 2),
+    note = CASE WHEN position(', ' IN o.note) > 0 THEN substr(o.note, position(', ' IN o.note) + 2) ELSE '' END
+FROM groups_archive g
+WHERE g.id = o.group_id AND g.category = '飲料'
+  AND o.sugar = '' AND o.note ~ '^[^/,]*糖[^/,]*/[^/,]*(冰|溫|熱)[^,]*(, |$)';
+
+-- 統計與匯出用：近期與封存資料合併查詢
+CREATE OR REPLACE VIEW all_groups AS
+    SELECT id, vendor_name, category, description, deadline, created_at, template_id, false AS archived FROM groups
+    UNION ALL
+    SELECT id, vendor_name, category, description, deadline, created_at, template_id, true AS archived FROM groups_archive;
+
+CREATE OR REPLACE VIEW all_orders AS
+    SELECT id, group_id, user_name, item_name, unit_price, quantity, total_price, note, ordered_at, false AS archived,
+           sugar, ice, options FROM orders
+    UNION ALL
+    SELECT id, group_id, user_name, item_name, unit_price, quantity, total_price, note, ordered_at, true AS archived,
+           sugar, ice, options FROM orders_archive;
+
 -- 建立索引加速查詢
 CREATE INDEX IF NOT EXISTS idx_orders_group_id ON orders(group_id);
 CREATE INDEX IF NOT EXISTS idx_groups_deadline ON groups(deadline);
+CREATE INDEX IF NOT EXISTS idx_orders_archive_group_id ON orders_archive(group_id);
+CREATE INDEX IF NOT EXISTS idx_groups_archive_deadline ON groups_archive(deadline);
+
+-- 訂單列表分頁（keyset pagination）：每個可排序欄位一組 (group_id, 欄位, id) 複合索引
+CREATE INDEX IF NOT EXISTS idx_orders_group_ordered_at ON orders(group_id, ordered_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_group_user_name ON orders(group_id, user_name, id);  -- 也用於「我的訂單」查詢
+CREATE INDEX IF NOT EXISTS idx_orders_group_item_name ON orders(group_id, item_name, id);
+CREATE INDEX IF NOT EXISTS idx_orders_group_total_price ON orders(group_id, total_price, id);
+
+-- 訂單關鍵字搜尋（ILIKE '%關鍵字%'）使用 trigram 索引
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_orders_user_name_trgm ON orders USING gin (user_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_orders_item_name_trgm ON orders USING gin (item_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_orders_note_trgm ON orders USING gin (note gin_trgm_ops);
 
 -- 啟用 Row Level Security（RLS）但允許所有操作（適合團隊內部使用）
 -- 如果你需要更嚴格的權限控制，可以自行修改 policy
 ALTER TABLE vendors ENABLE ROW LEVEL SECURITY;
 ALTER TABLE groups ENABLE ROW LEVEL SECURITY;
 ALTER TABLE orders ENABLE ROW LEVEL SECURITY;
+ALTER TABLE group_templates ENABLE ROW LEVEL SECURITY;
+ALTER TABLE groups_archive ENABLE ROW LEVEL SECURITY;
+ALTER TABLE orders_archive ENABLE ROW LEVEL SECURITY;
 
 -- 允許 anon key 存取所有資料（適合內部團購系統）
 DROP POLICY IF EXISTS "允許所有人讀寫 vendors" ON vendors;
@@ -68,6 +171,21 @@ CREATE POLICY "允許所有人讀寫 orders"
     ON orders FOR ALL
     USING (true) WITH CHECK (true);
 
+DROP POLICY IF EXISTS "允許所有人讀寫 group_templates" ON group_templates;
+CREATE POLICY "允許所有人讀寫 group_templates"
+    ON group_templates FOR ALL
+    USING (true) WITH CHECK (true);
+
+DROP POLICY IF EXISTS "允許所有人讀取 groups_archive" ON groups_archive;
+CREATE POLICY "允許所有人讀取 groups_archive"
+    ON groups_archive FOR SELECT
+    USING (true);
+
+DROP POLICY IF EXISTS "允許所有人讀取 orders_archive" ON orders_archive;
+CREATE POLICY "允許所有人讀取 orders_archive"
+    ON orders_archive FOR SELECT
+    USING (true);
+
 -- 自動更新 updated_at 欄位的觸發器
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -84,3 +202,92 @@ CREATE OR REPLACE TRIGGER vendors_updated_at
 CREATE OR REPLACE TRIGGER groups_updated_at
     BEFORE UPDATE ON groups
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- 依定期開團範本，一次建立每個範本接下來 p_occurrences 次的團購
+-- 菜單與圖片直接在資料庫內從店家複製，不需再由前端上傳；已建立過的場次會略過
+CREATE OR REPLACE FUNCTION create_groups_from_templates(p_occurrences INTEGER DEFAULT 1)
+RETURNS INTEGER AS $$
+DECLARE
+    today DATE := (now() AT TIME ZONE 'Asia/Taipei')::date;
+    inserted INTEGER;
+BEGIN
+    INSERT INTO groups (id, vendor_name, category, description, deadline, menu, menu_image_b64, template_id, option_sets)
+    SELECT gen_random_uuid()::text, v.vendor_name, v.category,
+           COALESCE(NULLIF(t.description, ''), v.description),
+           occ.deadline, v.menu, v.menu_image_b64, t.id, v.option_sets
+    FROM group_templates t
+    JOIN vendors v ON v.id = t.vendor_id
+    CROSS JOIN LATERAL (
+        SELECT (d::date + t.deadline_time) AT TIME ZONE 'Asia/Taipei' AS deadline
+        FROM generate_series(today, today + 7 * p_occurrences, INTERVAL '1 day') AS d
+        WHERE EXTRACT(ISODOW FROM d) - 1 = t.weekday
+          AND (d::date + t.deadline_time) AT TIME ZONE 'Asia/Taipei' > now()
+        ORDER BY d
+        LIMIT p_occurrences
+    ) AS occ
+    WHERE t.active
+    ON CONFLICT (template_id, deadline) DO NOTHING;
+
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$ LANGUAGE plpgsql;
+
+-- （選用）以 pg_cron 每天凌晨自動建立未來兩次的定期團購：
+-- SELECT cron.schedule('create-recurring-groups', '0 0 * * *', $$SELECT create_groups_from_templates(2)$$);
+
+-- 將收單超過 p_days 天的團購連同訂單搬到封存表，回傳封存的團購數
+-- SECURITY DEFINER：封存表只開放讀取，搬移由此函式以擁有者權限進行
+CREATE OR REPLACE FUNCTION archive_closed_groups(p_days INTEGER DEFAULT 30)
+RETURNS INTEGER AS $$
+DECLARE
+    cutoff TIMESTAMPTZ;
+    archived INTEGER;
+BEGIN
+    -- 任何人都能呼叫（SECURITY DEFINER），0 或負數會把進行中的團購也搬走，必須擋下
+    IF p_days IS NULL OR p_days < 1 THEN
+        RAISE EXCEPTION 'archive_closed_groups: p_days 必須至少為 1（收到 %）', p_days
+            USING ERRCODE = 'invalid_parameter_value';
+    END IF;
+    cutoff := now() - make_interval(days => p_days);
+
+    -- 鎖住要封存的團購，避免搬移期間有新訂單寫入（新增訂單需要對團購加 KEY SHARE 鎖）
+    PERFORM 1 FROM groups WHERE deadline < cutoff FOR UPDATE;
+
+    INSERT INTO groups_archive (id, vendor_name, category, description, deadline, created_at,
+                                menu, menu_image_b64, updated_at, template_id, option_sets)
+    SELECT id, vendor_name, category, description, deadline, created_at,
+           menu, menu_image_b64, updated_at, template_id, option_sets
+    FROM groups
+    WHERE deadline < cutoff
+    ON CONFLICT (id) DO NOTHING;
+
+    INSERT INTO orders_archive (id, group_id, user_name, item_name, unit_price, quantity,
+                                total_price, note, ordered_at, created_at, sugar, ice, options)
+    SELECT o.id, o.group_id, o.user_name, o.item_name, o.unit_price, o.quantity,
+           o.total_price, o.note, o.ordered_at, o.created_at, o.sugar, o.ice, o.options
+    FROM orders o
+    JOIN groups g ON g.id = o.group_id
+    WHERE g.deadline < cutoff
+    ON CONFLICT (id) DO NOTHING;
+
+    -- 訂單由 CASCADE 一併刪除
+    DELETE FROM groups WHERE deadline < cutoff;
+    GET DIAGNOSTICS archived = ROW_COUNT;
+    RETURN archived;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- （選用）以 pg_cron 每天凌晨封存收單超過 30 天的團購；使用排程時可將應用程式的
+-- ARCHIVE_CHECK_INTERVAL_SECONDS 設為 0，關閉應用程式內的背景封存：
+-- SELECT cron.schedule('archive-closed-groups', '30 0 * * *', $$SELECT archive_closed_groups(30)$$);
+
+-- 廠商叫貨單：依品項、甜度、冰塊、其他選項與備註彙總某團購（含已封存）的訂單
+CREATE OR REPLACE FUNCTION order_summary(p_group_id TEXT)
+RETURNS TABLE (item_name TEXT, sugar TEXT, ice TEXT, options JSONB, note TEXT, quantity BIGINT, total_price NUMERIC) AS $$
+    SELECT item_name, sugar, ice, options, COALESCE(note, ''), SUM(quantity), SUM(total_price)
+    FROM all_orders
+    WHERE group_id = p_group_id
+    GROUP BY item_name, sugar, ice, options, COALESCE(note, '')
+    ORDER BY item_name, sugar, ice, COALESCE(note, '');
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,188 @@
+"""
+跨副本共用快取
+店家（含菜單與圖片）、團購摘要與各團購的訂單彙總依「資料範圍」存放，每個範圍有一個版本號：
+- 讀取時以 (範圍, 版本號) 為鍵，快取中有就不必查資料庫，所有副本、所有 session 共用同一份
+- db_save_* / db_delete_* 寫入成功後遞增對應範圍的版本號，舊版本的快取自然失效，
+  各 session 每次重跑比對版本號即可得知其他副本的修改
+
+後端由環境變數 SHARED_CACHE_URL 決定：
+- 未設定：程序內記憶體（單一節點，同一程序的所有 session 共用；其他副本的修改只能等快取過期後看到）
+- redis://host:port/db：Redis 相容伺服器（多個副本共用；需要另外安裝 redis 套件）
+不經過本程式的寫入（pg_cron 排程、SQL 編輯器）不會遞增版本號，快取項目最多存放 SHARED_CACHE_TTL_SECONDS 秒後重新讀取資料庫。
+快取無法使用時一律視為未命中，改由資料庫讀取，不影響正常運作；連續失敗時由斷路器暫停呼叫，不必每次等待逾時。
+"""
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from circuit_breaker import CircuitBreaker
+
+SHARED_CACHE_URL = os.environ.get("SHARED_CACHE_URL", "")
+SHARED_CACHE_PREFIX = os.environ.get("SHARED_CACHE_PREFIX", "menu_work")
+# 快取項目的存活時間：版本號沒有遞增的修改（其他副本未共用快取、排程或 SQL 直接修改、Redis 暫時斷線），
+# 最多這麼久後仍會重新讀取資料庫
+SHARED_CACHE_TTL_SECONDS = int(os.environ.get("SHARED_CACHE_TTL_SECONDS", "600"))
+
+# 目錄的資料範圍：vendors（店家、菜單、圖片）、groups（團購摘要、菜單、圖片）
+SCOPES = ("vendors", "groups")
+
+
+def orders_scope(group_id: str) -> str:
+    """單一團購訂單的資料範圍；訂單異動只讓該團購的快取失效，不影響其他團購與目錄"""
+    return f"orders:{group_id}"
+
+
+class MemoryBackend:
+    """程序內記憶體後端；只保留最近存入的少數項目，每個項目存放 ttl 秒後過期"""
+
+    def __init__(self, max_entries: int = 128, ttl: float = SHARED_CACHE_TTL_SECONDS):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._ttl = ttl
+
+    def versions(self, scopes: tuple) -> tuple:
+        with self._lock:
+            return tuple(self._versions.get(scope, 0) for scope in scopes)
+
+    def bump(self, scope: str) -> int:
+        with self._lock:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+            return self._versions[scope]
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisBackend:
+    """Redis 相容伺服器後端；版本號以 INCR 遞增，資料以 JSON 存放並設定 TTL
+
+    最近讀過的項目另外保留在程序內，同一程序的 session 不必重複從 Redis 取回大型資料（例如圖片）。
+    """
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self._local = MemoryBackend()
+
+    def _key(self, name: str) -> str:
+        return f"{SHARED_CACHE_PREFIX}:{name}"
+
+    def versions(self, scopes: tuple) -> tuple:
+        values = self._client.mget([self._key(f"version:{scope}") for scope in scopes])
+        return tuple(int(value or 0) for value in values)
+
+    def bump(self, scope: str) -> int:
+        return int(self._client.incr(self._key(f"version:{scope}")))
+
+    def get(self, key: str):
+        # 程序內的副本與 Redis 中的項目同樣在 TTL 後過期
+        value = self._local.get(key)
+        if value is None:
+            raw = self._client.get(self._key(key))
+            if raw is None:
+                return None
+            value = json.loads(raw)
+            self._local.set(key, value)
+        return value
+
+    def set(self, key: str, value) -> None:
+        raw = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        self._client.set(self._key(key), raw, ex=SHARED_CACHE_TTL_SECONDS)
+        self._local.set(key, value)
+
+
+# 最近一次快取錯誤（顯示在系統資訊中）
+_last_error = None
+# 設定了 SHARED_CACHE_URL 卻無法使用（顯示在側邊欄）：各副本之間不會互相通知資料異動
+_setup_error = None
+
+# 同一程序內所有 session 共用；Redis 無法連線時不必每次重跑都等待逾時
+_breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get("SHARED_CACHE_BREAKER_THRESHOLD", "3")),
+    reset_timeout=float(os.environ.get("SHARED_CACHE_BREAKER_RESET_SECONDS", "30")),
+)
+
+
+def _create_backend():
+    global _setup_error
+    if not SHARED_CACHE_URL:
+        return MemoryBackend()
+    try:
+        return RedisBackend(SHARED_CACHE_URL)
+    except ImportError:
+        _setup_error = "已設定 SHARED_CACHE_URL 但未安裝 redis 套件，目前改用程序內記憶體"
+        return MemoryBackend()
+
+
+_backend = _create_backend()
+
+
+def status() -> dict:
+    """快取後端、設定錯誤與最近一次錯誤"""
+    return {
+        "backend": "Redis" if isinstance(_backend, RedisBackend) else "記憶體",
+        "breaker": _breaker.state,
+        "ttl_seconds": SHARED_CACHE_TTL_SECONDS,
+        "setup_error": _setup_error,
+        "last_error": _last_error,
+    }
+
+
+def _call(action: str, func, *args):
+    """經由斷路器呼叫後端；斷路器開路或呼叫失敗時回傳 None"""
+    global _last_error
+    if not _breaker.allow():
+        return None
+    try:
+        result = func(*args)
+    except Exception as e:
+        _breaker.record_failure()
+        _last_error = f"{action}: {e}"
+        return None
+    _breaker.record_success()
+    return result
+
+
+def versions(scopes: tuple = SCOPES) -> tuple:
+    """目前各範圍的版本號；快取無法使用時回傳 None"""
+    return _call("讀取版本號失敗", _backend.versions, scopes)
+
+
+def invalidate(*scopes: str) -> dict:
+    """遞增版本號，通知所有副本這些範圍的資料已變更；回傳 {範圍: 新版本號}（失敗的範圍不列入）"""
+    bumped = {}
+    for scope in scopes:
+        version = _call(f"失效通知失敗 ({scope})", _backend.bump, scope)
+        if version is not None:
+            bumped[scope] = version
+    return bumped
+
+
+def get(scope: str, version: int):
+    """取得某範圍某版本的資料列，未命中時回傳 None"""
+    return _call(f"讀取失敗 ({scope})", _backend.get, f"{scope}:{version}")
+
+
+def put(scope: str, version: int, value) -> None:
+    """存入某範圍某版本的資料列（version 應為查詢資料庫「之前」讀到的版本號）"""
+    _call(f"寫入失敗 ({scope})", _backend.set, f"{scope}:{version}", value)
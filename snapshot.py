@@ -0,0 +1,146 @@
+"""
+本機快照與離線寫入暫存
+- 快照：最後一次成功載入的原始資料列（gzip 壓縮 JSON），供啟動時立即顯示、資料庫離線時唯讀使用
+- 暫存寫入：資料庫離線期間的寫入動作（JSON Lines），恢復連線後依序重送
+"""
+import os
+import gzip
+import json
+import zlib
+import uuid
+import tempfile
+import threading
+import contextlib
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有程序內互斥
+    fcntl = None
+
+CACHE_DIR = os.environ.get("MENU_CACHE_DIR", ".cache")
+SNAPSHOT_PATH = os.path.join(CACHE_DIR, "catalog_snapshot.json.gz")
+PENDING_WRITES_PATH = os.path.join(CACHE_DIR, "pending_writes.jsonl")
+PENDING_WRITES_LOCK_PATH = f"{PENDING_WRITES_PATH}.lock"
+FLUSH_LOCK_PATH = f"{PENDING_WRITES_PATH}.flush.lock"
+
+# 同一個程序內的多個 session 共用檔案，寫入時需互斥
+_file_lock = threading.Lock()
+# 同一時間只允許一個重送暫存寫入的流程
+_flush_lock = threading.Lock()
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    """先寫到同目錄下不重複的暫存檔再取代，避免讀到寫一半的檔案（多個程序共用目錄時也不會互相覆寫暫存檔）"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+# ==================== 快照 ====================
+
+def save_snapshot(catalog: dict) -> None:
+    """儲存資料快照，catalog 為 {"vendors": [...], "groups": [...]}（訂單不存入快照）"""
+    payload = dict(catalog, saved_at=datetime.now().isoformat(timespec="seconds"))
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    with _file_lock:
+        _atomic_write(SNAPSHOT_PATH, gzip.compress(raw))
+
+
+def load_snapshot():
+    """讀取資料快照，不存在或損毀時回傳 None"""
+    try:
+        with open(SNAPSHOT_PATH, "rb") as f:
+            return json.loads(gzip.decompress(f.read()).decode("utf-8"))
+    except (OSError, ValueError, EOFError, zlib.error):  # 截斷的 gzip 為 EOFError，內容損毀為 zlib.error
+        return None
+
+
+def snapshot_saved_at():
+    """回傳快照的儲存時間，沒有快照時回傳 None"""
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(SNAPSHOT_PATH))
+    except OSError:
+        return None
+
+
+# ==================== 離線暫存寫入 ====================
+
+def has_pending_writes() -> bool:
+    """是否有尚未重送的寫入動作"""
+    return os.path.exists(PENDING_WRITES_PATH)
+
+
+@contextlib.contextmanager
+def _pending_file_lock():
+    """暫存寫入檔的互斥鎖：程序內的 session 之間用 threading.Lock，多個程序（共用同一目錄）之間用檔案鎖"""
+    os.makedirs(os.path.dirname(PENDING_WRITES_PATH) or ".", exist_ok=True)
+    with _file_lock, open(PENDING_WRITES_LOCK_PATH, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+@contextlib.contextmanager
+def pending_writes_flush_lock():
+    """重送暫存寫入的互斥鎖，整段「讀取 → 重送 → 移除」都要持有
+
+    不等待：已有其他 session 或程序正在重送時 yield False，呼叫者應視為暫存尚未送出。
+    """
+    if not _flush_lock.acquire(blocking=False):
+        yield False
+        return
+    try:
+        os.makedirs(os.path.dirname(FLUSH_LOCK_PATH) or ".", exist_ok=True)
+        with open(FLUSH_LOCK_PATH, "a") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+            yield True
+    finally:
+        _flush_lock.release()
+
+
+def append_pending_write(action: dict) -> None:
+    """新增一筆待重送的寫入動作（加上 pending_id，重送成功後依此移除）"""
+    action = dict(action, pending_id=action.get("pending_id") or uuid.uuid4().hex)
+    with _pending_file_lock():
+        with open(PENDING_WRITES_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(action, ensure_ascii=False) + "\n")
+
+
+def _read_pending_lines() -> list:
+    """回傳 [(pending_id, 原始行)]；舊版沒有 pending_id 的暫存以行號代替（新的暫存只會附加在後面，行號不變）"""
+    try:
+        with open(PENDING_WRITES_PATH, "r", encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+    except OSError:
+        return []
+    return [(json.loads(line).get("pending_id") or f"legacy-{index}", line) for index, line in enumerate(lines)]
+
+
+def read_pending_writes() -> list:
+    """讀取所有待重送的寫入動作（依寫入順序），每筆都帶有 pending_id"""
+    with _pending_file_lock():
+        return [dict(json.loads(line), pending_id=pending_id) for pending_id, line in _read_pending_lines()]
+
+
+def drop_pending_writes(pending_ids: set) -> None:
+    """移除已重送的寫入（依 pending_id；重送期間新增的暫存會保留）"""
+    with _pending_file_lock():
+        remaining = [line for pending_id, line in _read_pending_lines() if pending_id not in pending_ids]
+        if remaining:
+            _atomic_write(PENDING_WRITES_PATH, "".join(remaining).encode("utf-8"))
+        elif os.path.exists(PENDING_WRITES_PATH):
+            os.remove(PENDING_WRITES_PATH)
@@ -0,0 +1,409 @@
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+import db
+from db import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(db.time, "monotonic", fake)
+    return fake
+
+
+# ==================== 斷路器 ====================
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_open_allows_single_trial(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 31
+
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # 試探尚未回報
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_breaker_failed_trial_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 31
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_unreported_trial_expires(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 31
+    assert breaker.allow()
+
+    clock.now += 31
+    assert breaker.allow()
+
+
+# ==================== 連線錯誤判斷 ====================
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "https://example.supabase.co/rest/v1/orders")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+@pytest.mark.parametrize("error", [
+    httpx.ConnectError("connection refused"),
+    httpx.ReadTimeout("timed out"),
+    ConnectionResetError(),
+    TimeoutError(),
+    _status_error(502),
+    _status_error(503),
+    APIError({"message": "JSON could not be generated", "code": 502}),
+    APIError({"message": "JSON could not be generated", "code": 504}),
+    APIError({"message": "Service Unavailable", "code": "503"}),
+    APIError({"message": "Could not connect with the database", "code": "PGRST001"}),
+    APIError({"message": "terminating connection due to administrator command", "code": "57P01"}),
+    APIError({"message": "connection failure", "code": "08006"}),
+])
+def test_connection_errors(error):
+    assert db._is_connection_error(error)
+
+
+@pytest.mark.parametrize("error", [
+    _status_error(400),
+    _status_error(404),
+    APIError({"message": "duplicate key value violates unique constraint", "code": "23505"}),
+    APIError({"message": "insert or update violates foreign key constraint", "code": "23503"}),
+    APIError({"message": "JSON could not be generated", "code": 401}),
+    APIError({"message": "Could not find the table", "code": "PGRST205"}),
+    APIError({"message": "no code"}),
+    ValueError("bad row"),
+])
+def test_data_errors(error):
+    assert not db._is_connection_error(error)
+
+
+# ==================== 訂單批次寫入逾時 ====================
+
+class StuckWriter:
+    """送出後永遠不會完成的批次寫入器（模擬佇列塞車）"""
+
+    def submit(self, row):
+        from concurrent.futures import Future
+        return Future()
+
+
+class FailingWriter:
+    """寫入本身以 TimeoutError 失敗的批次寫入器（模擬資料庫連線逾時）"""
+
+    def submit(self, row):
+        from concurrent.futures import Future
+        future = Future()
+        future.set_exception(TimeoutError("read timed out"))
+        return future
+
+
+@pytest.fixture
+def order_env(tmp_path, monkeypatch):
+    import snapshot
+
+    path = str(tmp_path / "pending_writes.jsonl")
+    monkeypatch.setattr(snapshot, "PENDING_WRITES_PATH", path)
+    monkeypatch.setattr(snapshot, "PENDING_WRITES_LOCK_PATH", f"{path}.lock")
+    monkeypatch.setattr(snapshot, "FLUSH_LOCK_PATH", f"{path}.flush.lock")
+    monkeypatch.setattr(db, "DB_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(db, "OFFLINE_WRITE_MODE", "queue")
+    monkeypatch.setattr(db, "_breaker", CircuitBreaker(failure_threshold=1, reset_timeout=30))
+    return snapshot
+
+
+def _order_action():
+    return {"table": "orders", "op": "insert", "row": {"id": "o1", "group_id": "g1"}}
+
+
+def test_wait_timeout_is_not_an_outage(order_env, monkeypatch):
+    monkeypatch.setattr(db, "_order_writer", StuckWriter())
+
+    assert db._write(_order_action(), "儲存訂單失敗", apply=db._submit_order_to_batch)
+
+    assert db._breaker.state == "closed"
+    assert [a["row"]["id"] for a in order_env.read_pending_writes()] == ["o1"]
+
+
+def test_insert_timeout_is_an_outage(order_env, monkeypatch):
+    monkeypatch.setattr(db, "_order_writer", FailingWriter())
+
+    assert db._write(_order_action(), "儲存訂單失敗", apply=db._submit_order_to_batch)
+
+    assert db._breaker.state == "open"
+    assert [a["row"]["id"] for a in order_env.read_pending_writes()] == ["o1"]
+
+
+class RecordingClient:
+    """記錄查詢方法呼叫的假客戶端；execute() 回傳預先設定的資料列"""
+
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.calls = []
+
+    def table(self, name):
+        self.calls.append(("table", (name,), {}))
+        return self
+
+    def execute(self):
+        return type("Response", (), {"data": self.rows})()
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return method
+
+    def called(self, name) -> list:
+        return [(args, kwargs) for called, args, kwargs in self.calls if called == name]
+
+
+def test_replayed_insert_ignores_existing_id():
+    client = RecordingClient()
+
+    db._apply_write(client, _order_action(), replay=True)
+
+    assert client.called("upsert") == [((_order_action()["row"],), {"on_conflict": "id", "ignore_duplicates": True})]
+    assert client.called("insert") == []
+
+
+# ==================== 訂單分頁查詢 ====================
+
+@pytest.fixture
+def page_client(monkeypatch):
+    client = RecordingClient()
+    monkeypatch.setattr(db, "_get_supabase_client", lambda: client)
+    monkeypatch.setattr(db, "_breaker", CircuitBreaker())
+    return client
+
+
+def _order_rows(count: int) -> list:
+    return [{"id": f"o{i}", "user_name": f"user{i}", "ordered_at": f"2026-01-01T12:{i:02d}:00"} for i in range(count)]
+
+
+def test_orders_page_without_filter(page_client):
+    orders, next_cursor = db.db_load_orders_page("g1", limit=50)
+
+    assert orders == [] and next_cursor is None
+    assert page_client.called("eq") == [(("group_id", "g1"), {})]
+    assert page_client.called("or_") == []
+    assert page_client.called("order") == [(("ordered_at",), {"desc": False}), (("id",), {"desc": False})]
+    assert page_client.called("limit") == [((51,), {})]
+
+
+def test_orders_page_keyword_is_quoted(page_client):
+    db.db_load_orders_page("g1", query=' 半糖, (去冰) "大杯" \\ ')
+
+    pattern = '"*半糖, (去冰) \\"大杯\\" \\\\*"'
+    assert page_client.called("or_") == [((
+        f"and(or(user_name.ilike.{pattern},item_name.ilike.{pattern},sugar.ilike.{pattern},"
+        f"ice.ilike.{pattern},note.ilike.{pattern}))",
+    ), {})]
+
+
+@pytest.mark.parametrize("descending, op", [(False, "gt"), (True, "lt")])
+def test_orders_page_cursor_direction(page_client, descending, op):
+    db.db_load_orders_page("g1", sort_by="user_name", descending=descending, after=("王, (小明)", "o9"))
+
+    value = '"王, (小明)"'
+    assert page_client.called("or_") == [((
+        f'and(or(user_name.{op}.{value},and(user_name.eq.{value},id.{op}."o9")))',
+    ), {})]
+    assert page_client.called("order") == [(("user_name",), {"desc": descending}), (("id",), {"desc": descending})]
+
+
+def test_orders_page_combines_keyword_and_cursor(page_client):
+    db.db_load_orders_page("g1", query="奶茶", after=(120, "o3"), sort_by="total_price")
+
+    assert page_client.called("or_") == [((
+        'and(or(user_name.ilike."*奶茶*",item_name.ilike."*奶茶*",sugar.ilike."*奶茶*",'
+        'ice.ilike."*奶茶*",note.ilike."*奶茶*"),'
+        'or(total_price.gt."120",and(total_price.eq."120",id.gt."o3")))',
+    ), {})]
+
+
+def test_orders_page_next_cursor_from_extra_row(page_client):
+    page_client.rows = _order_rows(4)
+
+    orders, next_cursor = db.db_load_orders_page("g1", limit=3)
+
+    assert [o["id"] for o in orders] == ["o0", "o1", "o2"]
+    assert next_cursor == ("2026-01-01T12:02:00", "o2")
+
+
+def test_orders_page_last_page_has_no_cursor(page_client):
+    page_client.rows = _order_rows(3)
+
+    orders, next_cursor = db.db_load_orders_page("g1", limit=3)
+
+    assert len(orders) == 3
+    assert next_cursor is None
+
+
+def test_orders_page_rejects_unknown_sort_column(page_client):
+    with pytest.raises(ValueError):
+        db.db_load_orders_page("g1", sort_by="id; drop table orders")
+    assert page_client.calls == []
+
+
+# ==================== 共用快取版本號 ====================
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    import shared_cache
+
+    monkeypatch.setattr(shared_cache, "_backend", shared_cache.MemoryBackend())
+    return shared_cache
+
+
+def test_order_writes_only_touch_their_group(memory_cache):
+    db.db_remember_catalog_version()
+    before = memory_cache.versions((memory_cache.orders_scope("g2"),))
+
+    db._invalidate_cache({"table": "orders", "op": "insert", "row": {"id": "o1", "group_id": "g1"}})
+    db._invalidate_cache({"table": "orders", "op": "delete", "id": "o2", "group_id": "g1"})
+
+    assert not db.db_catalog_changed()
+    assert memory_cache.versions((memory_cache.orders_scope("g1"),)) == (2,)
+    assert memory_cache.versions((memory_cache.orders_scope("g2"),)) == before
+
+
+def test_own_catalog_write_is_not_a_change(memory_cache):
+    db.db_remember_catalog_version()
+
+    db._invalidate_cache({"table": "vendors", "op": "upsert", "row": {"id": "v1"}}, own_write=True)
+
+    assert not db.db_catalog_changed()
+
+
+def test_other_catalog_write_is_a_change(memory_cache):
+    db.db_remember_catalog_version()
+
+    db._invalidate_cache({"table": "groups", "op": "upsert", "row": {"id": "g1"}})
+
+    assert db.db_catalog_changed()
+
+
+def test_own_write_after_someone_elses_still_reloads(memory_cache):
+    db.db_remember_catalog_version()
+    memory_cache.invalidate("vendors")  # 其他副本的寫入
+
+    db._invalidate_cache({"table": "vendors", "op": "upsert", "row": {"id": "v1"}}, own_write=True)
+
+    assert db.db_catalog_changed()
+
+
+# ==================== 目錄載入與共用快取 ====================
+
+@pytest.fixture
+def catalog_db(monkeypatch, tmp_path, memory_cache):
+    """以假資料庫取代非同步查詢，記錄每次查詢的範圍；快照寫到暫存目錄"""
+    import contextlib
+    import snapshot
+
+    queries = []
+    rows = {"vendors": [{"id": "v1", "vendor_name": "五十嵐"}], "groups": []}
+
+    @contextlib.asynccontextmanager
+    async def session():
+        yield None, None
+
+    async def fetch(client, limiter, scopes):
+        queries.append(scopes)
+        return {scope: rows[scope] for scope in scopes}
+
+    monkeypatch.setattr(db, "_async_session", session)
+    monkeypatch.setattr(db, "_afetch_catalog", fetch)
+    monkeypatch.setattr(db, "_breaker", CircuitBreaker())
+    monkeypatch.setattr(db, "_snapshot_versions", None)
+    monkeypatch.setattr(snapshot, "SNAPSHOT_PATH", str(tmp_path / "catalog_snapshot.json.gz"))
+    return queries, rows
+
+
+def test_catalog_served_from_cache_until_it_expires(catalog_db, clock):
+    queries, _ = catalog_db
+
+    db._run_async(db._aload_catalog(("vendors", "groups")))
+    db._run_async(db._aload_catalog(("vendors", "groups")))
+    assert queries == [("vendors", "groups")]
+
+    clock.now += db.shared_cache.SHARED_CACHE_TTL_SECONDS
+    db._run_async(db._aload_catalog(("vendors", "groups")))
+    assert queries == [("vendors", "groups")] * 2
+
+
+def test_manual_reload_reads_the_database(catalog_db):
+    queries, rows = catalog_db
+    db._run_async(db._aload_catalog(("vendors", "groups")))
+    rows["vendors"] = [{"id": "v2", "vendor_name": "SQL 編輯器新增的店家"}]  # 不經過本程式的修改
+
+    db.db_invalidate_catalog()
+    catalog, _, fetched = db._run_async(db._aload_catalog(("vendors", "groups")))
+
+    assert fetched
+    assert catalog["vendors"] == rows["vendors"]
+
+
+def test_snapshot_saved_when_versions_change_without_querying(catalog_db, monkeypatch):
+    import snapshot
+
+    saved = []
+    monkeypatch.setattr(snapshot, "save_snapshot", lambda catalog: saved.append(catalog))
+    db._run_async(db.adb_load_all())
+    db._run_async(db.adb_load_all())
+    assert len(saved) == 1
+
+    # 其他副本寫入後把新版本存進共用快取，本程序只從快取取得
+    versions = db.shared_cache.invalidate("vendors")
+    db.shared_cache.put("vendors", versions["vendors"], [{"id": "v3"}])
+    vendors, _, source = db._run_async(db.adb_load_all())
+
+    assert source == "cloud" and [v["id"] for v in vendors] == ["v3"]
+    assert len(saved) == 2 and saved[-1]["vendors"] == [{"id": "v3"}]
+
+
+def test_session_reloads_after_cache_ttl(memory_cache, clock):
+    db.db_remember_catalog_version()
+    assert not db.db_catalog_changed()
+
+    clock.now += db.shared_cache.SHARED_CACHE_TTL_SECONDS
+    assert db.db_catalog_changed()
@@ -0,0 +1,125 @@
+import pandas as pd
+import pytest
+
+from menu_utils import (
+    index_menu, search_menu_index,
+    parse_option_sets, format_option_sets, get_order_option, missing_required_options, option_fields,
+)
+
+
+def _menu(*items) -> pd.DataFrame:
+    return pd.DataFrame([{"品名": name, "價格": price, "分區": section} for name, price, section in items])
+
+
+# ==================== 點餐菜單索引 ====================
+
+def test_index_groups_items_by_section():
+    index = index_menu(_menu(("紅茶", 30, "茶類"), ("珍珠奶茶", 50, "奶茶"), ("綠茶", 30, "茶類"), ("檸檬汁", 45, "")))
+
+    assert index["sections"] == {"茶類": [0, 2], "奶茶": [1], "其他": [3]}
+    assert index["order"] == [0, 2, 1, 3]
+    assert index["labels"][1] == "[奶茶] 珍珠奶茶 ($50)"
+    assert index["labels"][3] == "檸檬汁 ($45)"
+
+
+def test_index_without_sections_keeps_menu_order():
+    index = index_menu(pd.DataFrame({"品名": ["Latte", "紅茶"], "價格": [60, 30]}))
+
+    assert index["sections"] == {}
+    assert index["order"] == [0, 1]
+    assert index["labels"] == ["Latte ($60)", "紅茶 ($30)"]
+    assert index["keys"] == ["latte", "紅茶"]
+
+
+def test_search_ranks_prefix_then_substring_then_subsequence():
+    index = index_menu(_menu(
+        ("珍珠鮮奶", 60, ""),  # 字元依序出現
+        ("特級珍奶", 55, ""),  # 包含
+        ("珍奶", 45, ""),  # 前綴
+        ("珍珠奶茶", 50, ""),  # 字元依序出現
+        ("奶綠", 40, ""),  # 不符合
+    ))
+
+    # 同一層級內維持菜單順序
+    assert search_menu_index(index, "珍奶") == [2, 1, 0, 3]
+
+
+def test_search_is_case_and_whitespace_insensitive():
+    index = index_menu(pd.DataFrame({"品名": ["Iced Latte", "Americano"], "價格": [60, 50]}))
+
+    assert search_menu_index(index, "  LATTE ") == [0]
+    assert search_menu_index(index, "icl") == [0]
+
+
+def test_search_filters_by_section():
+    index = index_menu(_menu(("紅茶", 30, "茶類"), ("奶茶", 40, "奶茶"), ("綠茶", 30, "茶類")))
+
+    assert search_menu_index(index, "", "茶類") == [0, 2]
+    assert search_menu_index(index, "綠", "茶類") == [2]
+    assert search_menu_index(index, "奶", "茶類") == []
+    assert search_menu_index(index, "", "不存在的分區") == []
+
+
+def test_empty_query_returns_all_in_display_order():
+    index = index_menu(_menu(("紅茶", 30, "茶類"), ("奶茶", 40, "奶茶"), ("綠茶", 30, "茶類")))
+
+    assert search_menu_index(index, "") == [0, 2, 1]
+    assert search_menu_index(index, None) == [0, 2, 1]
+
+
+# ==================== 客製化選項 ====================
+
+def test_parse_option_sets():
+    text = "甜度：正常糖、半糖、無糖\n\n冰塊: 正常冰,少冰，去冰\n  加料：珍珠、椰果、珍珠、 \n"
+
+    assert parse_option_sets(text) == [
+        {"name": "甜度", "choices": ["正常糖", "半糖", "無糖"]},
+        {"name": "冰塊", "choices": ["正常冰", "少冰", "去冰"]},
+        {"name": "加料", "choices": ["珍珠", "椰果"]},  # 重複與空白的選項略過
+    ]
+    assert parse_option_sets("") == []
+
+
+@pytest.mark.parametrize("text, message", [
+    ("甜度 正常糖、半糖", "格式錯誤"),
+    ("甜度：", "格式錯誤"),
+    ("：正常糖", "格式錯誤"),
+    ("甜度：、，,", "格式錯誤"),
+    ("甜度：正常糖\n甜度：無糖", "重複"),
+])
+def test_parse_option_sets_rejects_malformed_lines(text, message):
+    with pytest.raises(ValueError, match=message):
+        parse_option_sets(text)
+
+
+def test_format_option_sets_round_trip():
+    option_sets = [{"name": "甜度", "choices": ["半糖", "無糖"]}, {"name": "尺寸", "choices": ["中杯", "大杯"]}]
+
+    assert format_option_sets(option_sets) == "甜度：半糖、無糖\n尺寸：中杯、大杯"
+    assert parse_option_sets(format_option_sets(option_sets)) == option_sets
+
+
+def test_sugar_and_ice_get_their_own_columns():
+    selections = {"甜度": "半糖 (5分)", "冰塊": "少冰", "加料": "珍珠", "尺寸": ""}
+
+    assert option_fields(selections) == {"甜度": "半糖 (5分)", "冰塊": "少冰", "選項": {"加料": "珍珠"}}
+    assert option_fields({"加料": "椰果"}) == {"甜度": "", "冰塊": "", "選項": {"加料": "椰果"}}
+
+
+def test_only_sugar_and_ice_are_required():
+    option_sets = [
+        {"name": "甜度", "choices": ["半糖"]},
+        {"name": "冰塊", "choices": ["少冰"]},
+        {"name": "加料", "choices": ["珍珠"]},
+    ]
+
+    assert missing_required_options(option_sets, {"甜度": "", "加料": ""}) == ["甜度", "冰塊"]
+    assert missing_required_options(option_sets, {"甜度": "半糖", "冰塊": "少冰"}) == []
+    assert missing_required_options([{"name": "加料", "choices": ["珍珠"]}], {}) == []
+
+
+def test_get_order_option_reads_columns_and_options():
+    order = {"甜度": "無糖", "冰塊": "去冰", "選項": {"加料": "布丁"}}
+
+    assert [get_order_option(order, name) for name in ("甜度", "冰塊", "加料", "尺寸")] == ["無糖", "去冰", "布丁", ""]
+    assert get_order_option({"選項": None}, "加料") == ""
@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from order_writer import OrderBatchWriter
+
+
+class RecordingInserter:
+    """記錄每次批次寫入；rows 中含 bad=True 的列時視為資料錯誤"""
+
+    def __init__(self, error=ValueError):
+        self.batches = []
+        self.error = error
+        self.lock = threading.Lock()
+
+    def __call__(self, rows):
+        with self.lock:
+            self.batches.append([row["id"] for row in rows])
+        if any(row.get("bad") for row in rows):
+            raise self.error("bad row")
+
+
+def test_orders_within_window_share_one_batch():
+    inserter = RecordingInserter()
+    writer = OrderBatchWriter(inserter, window_ms=200)
+
+    futures = [writer.submit({"id": i}) for i in range(5)]
+
+    assert all(future.result(timeout=5) for future in futures)
+    assert inserter.batches == [[0, 1, 2, 3, 4]]
+    stats = writer.stats()
+    assert stats["total_batches"] == 1
+    assert stats["total_orders"] == 5
+    assert stats["max_batch_size"] == 5
+
+
+def test_batch_is_split_at_max_batch_size():
+    inserter = RecordingInserter()
+    writer = OrderBatchWriter(inserter, window_ms=200, max_batch_size=2)
+
+    futures = [writer.submit({"id": i}) for i in range(5)]
+
+    for future in futures:
+        future.result(timeout=5)
+    assert [len(batch) for batch in inserter.batches] == [2, 2, 1]
+
+
+def test_data_error_bisects_and_fails_only_bad_row():
+    inserter = RecordingInserter()
+    writer = OrderBatchWriter(inserter, window_ms=200)
+
+    futures = [writer.submit({"id": i, "bad": i == 2}) for i in range(4)]
+
+    for i, future in enumerate(futures):
+        if i == 2:
+            with pytest.raises(ValueError):
+                future.result(timeout=5)
+        else:
+            assert future.result(timeout=5) is True
+    assert inserter.batches[0] == [0, 1, 2, 3]
+    assert [2] in inserter.batches
+
+
+def test_connection_error_fails_whole_batch_without_bisect():
+    inserter = RecordingInserter(error=ConnectionError)
+    writer = OrderBatchWriter(inserter, window_ms=200, is_connection_error=lambda e: isinstance(e, ConnectionError))
+
+    futures = [writer.submit({"id": i, "bad": i == 0}) for i in range(3)]
+
+    for future in futures:
+        with pytest.raises(ConnectionError):
+            future.result(timeout=5)
+    assert inserter.batches == [[0, 1, 2]]
+
+
+def test_slow_insert_times_out_waiter_but_still_completes():
+    release = threading.Event()
+
+    def slow_insert(rows):
+        release.wait(5)
+
+    writer = OrderBatchWriter(slow_insert, window_ms=1)
+    future = writer.submit({"id": 1})
+
+    with pytest.raises(TimeoutError):
+        future.result(timeout=0.05)
+    assert not future.done()
+
+    release.set()
+    assert future.result(timeout=5) is True
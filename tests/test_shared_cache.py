@@ -0,0 +1,110 @@
+import sys
+
+import pytest
+
+import shared_cache
+from circuit_breaker import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(shared_cache.time, "monotonic", fake)
+    return fake
+
+
+class DownBackend:
+    """每次呼叫都失敗的後端（模擬 Redis 無法連線），記錄被呼叫的次數"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _fail(self, *args):
+        self.calls += 1
+        raise ConnectionError("Timeout connecting to server")
+
+    versions = bump = get = set = _fail
+
+
+@pytest.fixture
+def down_backend(monkeypatch, clock):
+    backend = DownBackend()
+    monkeypatch.setattr(shared_cache, "_backend", backend)
+    monkeypatch.setattr(shared_cache, "_breaker", CircuitBreaker(failure_threshold=2, reset_timeout=30))
+    return backend
+
+
+# ==================== 記憶體後端 ====================
+
+def test_memory_entries_expire(clock):
+    backend = shared_cache.MemoryBackend(ttl=60)
+    backend.set("vendors:1", [{"id": "v1"}])
+
+    clock.now += 59
+    assert backend.get("vendors:1") == [{"id": "v1"}]
+    clock.now += 1
+    assert backend.get("vendors:1") is None
+
+
+def test_memory_keeps_latest_entries():
+    backend = shared_cache.MemoryBackend(max_entries=2)
+    for version in range(3):
+        backend.set(f"groups:{version}", version)
+
+    assert backend.get("groups:0") is None
+    assert [backend.get(f"groups:{version}") for version in (1, 2)] == [1, 2]
+
+
+def test_bump_returns_new_version(monkeypatch):
+    monkeypatch.setattr(shared_cache, "_backend", shared_cache.MemoryBackend())
+
+    assert shared_cache.invalidate("vendors", "groups") == {"vendors": 1, "groups": 1}
+    assert shared_cache.invalidate("vendors") == {"vendors": 2}
+    assert shared_cache.versions() == (2, 1)
+
+
+# ==================== 斷路器 ====================
+
+def test_failures_open_the_breaker(down_backend):
+    assert shared_cache.versions() is None
+    assert shared_cache.get("vendors", 1) is None
+    assert down_backend.calls == 2
+
+    # 開路後不再呼叫後端，也不必等待逾時
+    assert shared_cache.versions() is None
+    assert shared_cache.invalidate("groups") == {}
+    shared_cache.put("groups", 1, [])
+    assert down_backend.calls == 2
+    assert shared_cache.status()["breaker"] == "open"
+    assert "Timeout connecting" in shared_cache.status()["last_error"]
+
+
+def test_breaker_retries_after_reset(down_backend, clock, monkeypatch):
+    shared_cache.versions()
+    shared_cache.versions()
+    clock.now += 31
+    monkeypatch.setattr(shared_cache, "_backend", shared_cache.MemoryBackend())
+
+    assert shared_cache.versions() == (0, 0)
+    assert shared_cache.status()["breaker"] == "closed"
+
+
+# ==================== 後端設定 ====================
+
+def test_missing_redis_package_is_reported(monkeypatch):
+    monkeypatch.setattr(shared_cache, "SHARED_CACHE_URL", "redis://cache:6379/0")
+    monkeypatch.setattr(shared_cache, "_setup_error", None)
+    monkeypatch.setitem(sys.modules, "redis", None)  # import redis 會拋出 ImportError
+
+    backend = shared_cache._create_backend()
+
+    assert isinstance(backend, shared_cache.MemoryBackend)
+    assert "redis" in shared_cache.status()["setup_error"]
@@ -0,0 +1,117 @@
+import gzip
+import os
+import threading
+
+import pytest
+
+import snapshot
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / "pending_writes.jsonl")
+    monkeypatch.setattr(snapshot, "PENDING_WRITES_PATH", path)
+    monkeypatch.setattr(snapshot, "PENDING_WRITES_LOCK_PATH", f"{path}.lock")
+    monkeypatch.setattr(snapshot, "FLUSH_LOCK_PATH", f"{path}.flush.lock")
+    monkeypatch.setattr(snapshot, "SNAPSHOT_PATH", str(tmp_path / "catalog_snapshot.json.gz"))
+
+
+# ==================== 快照 ====================
+
+def test_snapshot_round_trip(tmp_path):
+    snapshot.save_snapshot({"vendors": [{"id": "v1"}], "groups": []})
+
+    assert snapshot.load_snapshot()["vendors"] == [{"id": "v1"}]
+    assert os.listdir(tmp_path) == ["catalog_snapshot.json.gz"]  # 沒有殘留暫存檔
+
+
+@pytest.mark.parametrize("content", [
+    b"",
+    b"not gzip at all",
+    gzip.compress(b'{"vendors": []}')[:-12],  # 截斷（EOFError）
+    gzip.compress(b'{"vendors": []}')[:10] + b"\xff" * 20,  # 內容損毀（zlib.error）
+    gzip.compress(b'{"vendors": '),  # JSON 不完整
+])
+def test_damaged_snapshot_returns_none(content):
+    with open(snapshot.SNAPSHOT_PATH, "wb") as f:
+        f.write(content)
+
+    assert snapshot.load_snapshot() is None
+
+
+def test_concurrent_snapshot_writes_stay_readable():
+    payloads = [gzip.compress(f"snapshot {i} ".encode() * 20000) for i in range(8)]
+    threads = [threading.Thread(target=snapshot._atomic_write, args=(snapshot.SNAPSHOT_PATH, payload))
+               for payload in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(snapshot.SNAPSHOT_PATH, "rb") as f:
+        assert f.read() in payloads
+
+
+# ==================== 離線暫存寫入 ====================
+
+def test_pending_writes_get_ids():
+    snapshot.append_pending_write({"table": "orders", "op": "insert", "row": {"id": "a"}})
+    snapshot.append_pending_write({"table": "orders", "op": "delete", "id": "b"})
+
+    actions = snapshot.read_pending_writes()
+    assert [a["op"] for a in actions] == ["insert", "delete"]
+    assert len({a["pending_id"] for a in actions}) == 2
+
+
+def test_drop_keeps_writes_appended_during_replay():
+    snapshot.append_pending_write({"table": "orders", "op": "delete", "id": "first"})
+    read = snapshot.read_pending_writes()
+    # 重送期間其他 session 又暫存了一筆
+    snapshot.append_pending_write({"table": "orders", "op": "delete", "id": "second"})
+
+    snapshot.drop_pending_writes({action["pending_id"] for action in read})
+
+    assert [a["id"] for a in snapshot.read_pending_writes()] == ["second"]
+
+
+def test_drop_all_removes_file():
+    snapshot.append_pending_write({"table": "orders", "op": "delete", "id": "x"})
+    snapshot.drop_pending_writes({a["pending_id"] for a in snapshot.read_pending_writes()})
+
+    assert not snapshot.has_pending_writes()
+    assert snapshot.read_pending_writes() == []
+
+
+def test_legacy_lines_without_id(tmp_path):
+    with open(snapshot.PENDING_WRITES_PATH, "w", encoding="utf-8") as f:
+        f.write('{"table": "orders", "op": "delete", "id": "old1"}\n')
+        f.write('{"table": "orders", "op": "delete", "id": "old2"}\n')
+
+    first = snapshot.read_pending_writes()[0]
+    snapshot.drop_pending_writes({first["pending_id"]})
+
+    assert [a["id"] for a in snapshot.read_pending_writes()] == ["old2"]
+
+
+def test_only_one_flush_at_a_time():
+    results = []
+    entered = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with snapshot.pending_writes_flush_lock() as acquired:
+            results.append(acquired)
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    entered.wait(5)
+    with snapshot.pending_writes_flush_lock() as acquired:
+        results.append(acquired)
+    release.set()
+    thread.join()
+
+    with snapshot.pending_writes_flush_lock() as acquired:
+        results.append(acquired)
+    assert results == [True, False, True]